@@ -83,10 +83,10 @@ def plot_fitness(results, params, output_path):
     elif params['problem'] == 'drive':
         dataset = 'DRIVE'
 
-    if params['compiler'] == 'gcc':
-        hardware = 'CPU'
-    elif params['compiler'] == 'nvcc':
+    if params['compiler'] == 'nvcc':
         hardware = 'GPU'
+    else:
+        hardware = 'CPU'
 
     plt.errorbar(gen, mean_fitness_values, yerr=std_fitness_values, color=colors[3], label="Average")
     plt.plot(min_fitness_values, color=colors[5], label='Best individual')
@@ -119,10 +119,10 @@ def plot_genome_length(results, params, output_path):
     elif params['problem'] == 'drive':
         dataset = 'DRIVE'
 
-    if params['compiler'] == 'gcc':
-        hardware = 'CPU'
-    elif params['compiler'] == 'nvcc':
+    if params['compiler'] == 'nvcc':
         hardware = 'GPU'
+    else:
+        hardware = 'CPU'
 
     plt.plot(avg_length, color=colors[1], label="Average")
     plt.plot(best_ind_length, color=colors[3], label="Best individual")
@@ -151,10 +151,10 @@ def plot_confusion_matrix(y_true, y_pred, params, output_path):
     elif params['problem'] == 'drive':
         dataset = 'DRIVE'
 
-    if params['compiler'] == 'gcc':
-        hardware = 'CPU'
-    elif params['compiler'] == 'nvcc':
+    if params['compiler'] == 'nvcc':
         hardware = 'GPU'
+    else:
+        hardware = 'CPU'
 
     ConfusionMatrixDisplay.from_predictions(y_true, y_pred, labels=[0, 1], values_format=',d',cmap='Blues')
     cb = plt.gca().images[-1].colorbar
@@ -175,10 +175,10 @@ def visualise_spiral(expression, params, output_path):
     # Returns
         None.
     """
-    if params['compiler'] == 'gcc':
-        hardware = 'CPU'
-    elif params['compiler'] == 'nvcc':
+    if params['compiler'] == 'nvcc':
         hardware = 'GPU'
+    else:
+        hardware = 'CPU'
 
     colors = mpl.colormaps['Paired'].colors
 
@@ -203,14 +203,16 @@ def visualise_spiral(expression, params, output_path):
     plt.clf()
 
 
-def visualise_drive(expression, params, output_path):
+def visualise_drive(expression, params, output_path, y_test_class=None):
     """Produces images to visualise the annotation on a sample test image from 
-    DRIVE.
+    DRIVE and, if predictions are given, on every test image.
 
     # Arguments
         expression: A string containing the code expression for an individual.
         params: A dictionary containing GE parameters.
         output_path: A string containing the path for the output directory.
+        y_test_class: A NumPy array of predicted classes for the test set or 
+            None.
     
     # Returns
         None.
@@ -224,6 +226,13 @@ def visualise_drive(expression, params, output_path):
     Image.fromarray(mask).save(os.path.join(output_path, 'sample_mask.gif'))
     Image.fromarray(annotation).save(os.path.join(output_path, 'sample_annotation.gif'))
 
+    if y_test_class is not None:
+        image_ids, _, _, masks = datasets.drive_get_test_images()
+        annotations = datasets.drive_annotate_sample_image(masks, y_test_class)
+
+        for image_id, annotation in zip(image_ids, annotations):
+            Image.fromarray(annotation).save(os.path.join(output_path, f'{image_id}_annotation.gif'))
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -298,7 +307,7 @@ def main():
     if params['problem'] == 'spiral':
         visualise_spiral(best_run_expression, params, output_path)
     elif params['problem'] == 'drive':
-        visualise_drive(best_run_expression, params, output_path)
+        visualise_drive(best_run_expression, params, output_path, best_run_prediction)
 
 
 if __name__ == "__main__":
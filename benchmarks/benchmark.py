@@ -0,0 +1,234 @@
+# benchmark.py
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ge
+import codegen
+import datasets
+import imagedata
+import ir
+
+import grape.grape as grape
+
+import argparse
+import csv
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+def load_data(problem, n_samples, random_seed=0, synthetic=False):
+    """Loads benchmark data for a problem. DRIVE samples are taken from the
+    real dataset when it has already been downloaded, and otherwise a 
+    synthetic matrix with the same shape and value range is generated.
+
+    # Arguments
+        problem: A string indicating the problem.
+        n_samples: Number of samples as an integer.
+        random_seed: Random seed value as an integer.
+        synthetic: A boolean indicating whether to always use synthetic data.
+
+    # Returns
+        A tuple containing a float32 NumPy array of features, a uint8 NumPy
+        array of classes, and a string describing the data source.
+    """
+    rng = np.random.default_rng(random_seed)
+
+    if problem == 'drive':
+        # Only a dataset that is already downloaded is used, so that a 
+        # benchmark never starts a download.
+        if not synthetic and datasets.drive_local_path():
+            try:
+                X, y = datasets.drive(n_samples=n_samples)[::2]
+                if len(X) == n_samples:
+                    return np.asarray(X, dtype=np.float32), np.asarray(y, dtype=np.uint8), 'drive'
+            except FileNotFoundError as e:
+                print(f"Incomplete DRIVE dataset, using synthetic data: {e}")
+
+        X = imagedata.SCALE[rng.integers(0, 256, size=(n_samples, 49))]
+        y = rng.integers(0, 2, size=n_samples).astype(np.uint8)
+
+        return X, y, 'synthetic'
+
+    X = rng.uniform(-6.5, 6.5, size=(n_samples, 2)).astype(np.float32)
+    y = rng.integers(0, 2, size=n_samples).astype(np.uint8)
+
+    return X, y, 'synthetic'
+
+
+def create_population(problem, n_registers, pop_size, random_seed=0,
+                      max_init_depth=12, min_init_depth=7):
+    """Generates a seeded random population from the grammar of a problem.
+
+    # Arguments
+        problem: A string indicating the problem.
+        n_registers: Number of registers as an integer.
+        pop_size: Population size as an integer.
+        random_seed: Random seed value as an integer.
+        max_init_depth: Maximum initial depth as an integer.
+        min_init_depth: Minimum initial depth as an integer.
+
+    # Returns
+        A list of grape.Individual objects.
+    """
+    random.seed(random_seed)
+    np.random.seed(random_seed)
+
+    bnf_grammar = grape.Grammar(os.path.join(ROOT, 'grammars', f'{problem}_{n_registers}.bnf'))
+    toolbox = ge.create_toolbox(tournsize=3)
+
+    return toolbox.populationCreator(pop_size=pop_size,
+                                     bnf_grammar=bnf_grammar,
+                                     min_init_depth=min_init_depth,
+                                     max_init_depth=max_init_depth,
+                                     codon_size=255,
+                                     codon_consumption='lazy',
+                                     genome_representation='list')
+
+
+def measure(function, repeats):
+    """Times repeated calls of a function.
+
+    # Arguments
+        function: A function without arguments.
+        repeats: Number of repeats as an integer.
+
+    # Returns
+        A list of durations in seconds.
+    """
+    durations = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start_time)
+
+    return durations
+
+
+def benchmark(problem, backend, pop_size, n_registers, n_samples, repeats=3,
+              random_seed=0, synthetic=False, check=False):
+    """Times codegen.run_program and ge.fitness_eval for one configuration.
+
+    # Arguments
+        problem: A string indicating the problem.
+        backend: A string indicating the compiler to use.
+        pop_size: Population size as an integer.
+        n_registers: Number of registers as an integer.
+        n_samples: Number of samples as an integer.
+        repeats: Number of repeats as an integer.
+        random_seed: Random seed value as an integer.
+        synthetic: A boolean indicating whether to always use synthetic data.
+        check: A boolean indicating whether to check that the CUDA program 
+            compiled for the host matches the GCC backend before timing 
+            nvcc-host.
+
+    # Returns
+        A list of dictionaries, one per timed function.
+    """
+    X, y, source = load_data(problem, n_samples, random_seed, synthetic)
+    population = create_population(problem, n_registers, pop_size, random_seed)
+
+    # The drive grammars use an extra register as temporary storage.
+    n_registers_program = n_registers + 1 if problem == 'drive' else n_registers
+
+    programs = [ir.parse(ind.phenotype) for ind in population if not ind.invalid]
+    points = ([X, y], backend, n_registers_program)
+
+    if check and backend == 'nvcc-host':
+        assert codegen.check_nvcc(X, programs, n_registers_program), \
+            f"nvcc-host predictions differ from gcc for {problem} with {n_registers} registers"
+
+    def run_program():
+        codegen.run_program(X, programs, backend, n_registers_program)
+
+    def fitness_eval():
+        for ind in population:
+            if ind.fitness.valid:
+                del ind.fitness.values
+        ge.phenotype_cache.clear()
+        ge.fitness_eval(population, points)
+
+    # Warm up sessions and the interpreter library.
+    run_program()
+
+    results = []
+    for name, function in [('run_program', run_program), ('fitness_eval', fitness_eval)]:
+        durations = measure(function, repeats)
+        median = statistics.median(durations)
+
+        results.append({'problem': problem, 'data': source, 'backend': backend,
+                        'function': name, 'pop_size': pop_size,
+                        'n_programs': len(programs),
+                        'n_registers': n_registers, 'n_samples': n_samples,
+                        'repeats': repeats, 'min_time': min(durations),
+                        'median_time': median,
+                        'evaluations_per_second': len(programs) * n_samples / median})
+
+    return results
+
+
+def main():
+    timestamp = datetime.now().replace(microsecond=0).isoformat().replace(':', '')
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-o", "--output", default=os.path.join(ROOT, 'benchmarks', 'results', timestamp))
+    parser.add_argument("--problems", nargs='+', default=['spiral', 'drive'], choices=['spiral', 'drive'])
+    parser.add_argument("--backends", nargs='+', default=['gcc', 'interpreter', 'numpy'],
+                        choices=['gcc', 'nvcc', 'nvcc-host', 'interpreter', 'numpy'])
+    parser.add_argument("--pop_sizes", nargs='+', type=int, default=[100, 500])
+    parser.add_argument("--registers", nargs='+', type=int, default=[2, 8])
+    parser.add_argument("--samples", nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synthetic", action='store_true')
+    parser.add_argument("--check", action='store_true')
+
+    kwargs = dict(parser.parse_args()._get_kwargs())
+
+    results = []
+    for problem in kwargs['problems']:
+        for n_registers in kwargs['registers']:
+            if not os.path.exists(os.path.join(ROOT, 'grammars', f'{problem}_{n_registers}.bnf')):
+                print(f"Skipping {problem} with {n_registers} registers: no grammar")
+                continue
+
+            for backend in kwargs['backends']:
+                for pop_size in kwargs['pop_sizes']:
+                    for n_samples in kwargs['samples']:
+                        for result in benchmark(problem, backend, pop_size, n_registers,
+                                                n_samples, kwargs['repeats'], kwargs['seed'], 
+                                                kwargs['synthetic'], kwargs['check']):
+                            results.append(result)
+                            print(f"{problem} {backend} {result['function']}: "
+                                  f"{result['n_programs']} programs x {n_samples} samples, "
+                                  f"{n_registers} registers: {result['median_time']:.4f}s "
+                                  f"({result['evaluations_per_second']:,.0f} evaluations/s)")
+
+    os.makedirs(os.path.dirname(kwargs['output']) or '.', exist_ok=True)
+
+    with open(f"{kwargs['output']}.json", "w") as jsonfile:
+        json.dump({'platform': platform.platform(),
+                   'python': platform.python_version(),
+                   'cpu_count': os.cpu_count(),
+                   'numpy': np.__version__,
+                   'settings': kwargs,
+                   'results': results}, jsonfile, indent=4)
+
+    with open(f"{kwargs['output']}.csv", "w", encoding='UTF8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(results[0]) if results else [], delimiter='\t')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
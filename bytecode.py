@@ -0,0 +1,78 @@
+# bytecode.py
+
+import re
+
+ADD, SUB, MUL, PDIV, AQ, MOV, SIN, COS, TANH, IF_GT = range(10)
+
+OPCODES = {'add': ADD, 'sub': SUB, 'mul': MUL, 'pdiv': PDIV, 'aq': AQ,
+           'mov': MOV, 'sin': SIN, 'cos': COS, 'tanh': TANH, 'if_gt': IF_GT}
+
+ASSIGN_OPS = {'+': 'add', '-': 'sub', '*': 'mul'}
+FUNCTIONS = {'sinf': 'sin', 'cosf': 'cos', 'tanhf': 'tanh'}
+
+PATTERNS = [
+    ('assign', re.compile(r'^(\S+) ([+\-*])= (\S+);$')),
+    ('pdiv', re.compile(r'^(\S+) = \((\S+) != 0\) \? \1 / \2 : \1 \+ 10e6;$')),
+    ('aq', re.compile(r'^(\S+) = \1 / sqrt\(1 \+ pow\((\S+), 2\)\);$')),
+    ('swap', re.compile(r'^(\S+) = (\S+); \2 = (\S+); \3 = \1;$')),
+    ('function', re.compile(r'^(\S+) = (sinf|cosf|tanhf)\(\1\);$')),
+    ('if_gt', re.compile(r'^if \((\S+) > (\S+)\)$')),
+    ('mov', re.compile(r'^(\S+) = (\S+);$'))
+]
+
+OPERAND = re.compile(r'^(r|x)\[(\d+)\]$')
+
+
+def parse_line(line):
+    """Parses a line of C code produced by the instructions module.
+
+    # Arguments
+        line: A string containing a line of C code.
+
+    # Returns
+        A list of (name, a, b) tuples with operands as strings. Swaps are
+        expanded into three moves so that a preceding if_gt only guards the
+        first of them, as in C.
+    """
+    line = line.strip()
+
+    for kind, pattern in PATTERNS:
+        match = pattern.match(line)
+        if not match:
+            continue
+
+        if kind == 'assign':
+            return [(ASSIGN_OPS[match[2]], match[1], match[3])]
+        elif kind == 'pdiv':
+            return [('pdiv', match[1], match[2])]
+        elif kind == 'aq':
+            return [('aq', match[1], match[2])]
+        elif kind == 'swap':
+            temp, a, b = match[1], match[2], match[3]
+            return [('mov', temp, a), ('mov', a, b), ('mov', b, temp)]
+        elif kind == 'function':
+            return [(FUNCTIONS[match[2]], match[1], match[1])]
+        elif kind == 'if_gt':
+            return [('if_gt', match[1], match[2])]
+        elif kind == 'mov':
+            return [('mov', match[1], match[2])]
+
+    raise ValueError(f'Unrecognised instruction: {line!r}')
+
+
+def parse_expression(expression):
+    """Parses a code expression into a list of instructions.
+
+    # Arguments
+        expression: A string containing the code expression for an individual.
+
+    # Returns
+        A list of (name, a, b) tuples with operands as strings.
+    """
+    instructions = []
+    for line in expression.splitlines():
+        if line.strip():
+            instructions.extend(parse_line(line))
+
+    return instructions
+
@@ -0,0 +1,283 @@
+# cache.py
+
+import hashlib
+from collections import OrderedDict, deque
+
+import numpy as np
+
+import imagedata
+
+
+def fingerprint(*arrays):
+    """Computes a content hash for a collection of NumPy arrays.
+
+    # Arguments
+        arrays: NumPy arrays or imagedata.WindowedImages objects to include in 
+            the fingerprint.
+
+    # Returns
+        A hexadecimal digest as a string.
+    """
+    h = hashlib.sha1()
+    for array in arrays:
+        if isinstance(array, imagedata.WindowedImages):
+            h.update(f'windows{array.window_size}'.encode())
+            h.update(fingerprint(array.images, array.offsets).encode())
+            continue
+
+        array = np.ascontiguousarray(array)
+        h.update(f'{array.dtype.str}{array.shape}'.encode())
+        h.update(array)
+
+    return h.hexdigest()
+
+
+class PhenotypeCache:
+    """Least-recently-used cache mapping hashed program text to predictions
+    and fitness. Entries are stored per dataset and only served for the 
+    dataset the cache is scoped to, so that alternating between datasets, 
+    such as the batches of fitness sampling, keeps the entries of each.
+    """
+    def __init__(self, max_entries=10000, max_bytes=256 * 2 ** 20, 
+                 max_scopes=16):
+        """Initialises the PhenotypeCache object.
+
+        # Arguments
+            max_entries: Maximum number of entries as an integer. Zero
+                disables the cache.
+            max_bytes: Maximum total size of stored predictions in bytes as
+                an integer.
+            max_scopes: Number of recently used datasets whose fingerprints 
+                are remembered by array identity as an integer.
+
+        # Returns
+            None.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.dataset = None
+        self.scopes = deque(maxlen=max_scopes)
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def key(program, compiler, n_registers, profile=None):
+        """Builds the cache key for a program from its arrays.
+
+        # Arguments
+            program: An ir.Program object.
+            compiler: A string indicating the compiler to use.
+            n_registers: Number of registers as an integer.
+            profile: A string with the name of the compile profile, or None 
+                for backends that are not compiled.
+
+        # Returns
+            A hexadecimal digest as a string.
+        """
+        h = hashlib.sha1(f'{compiler}\0{profile}\0{n_registers}\0{len(program)}\0{len(program.consts)}'.encode())
+        for array in (program.opcodes, program.dests, program.srcs, program.consts):
+            h.update(np.ascontiguousarray(array).tobytes())
+
+        return h.hexdigest()
+
+
+    def scope(self, x, y):
+        """Scopes the cache to a dataset. Entries of other datasets are kept 
+        until they are evicted.
+
+        # Arguments
+            x: A NumPy array of input samples.
+            y: A NumPy array of expected classes.
+
+        # Returns
+            None.
+        """
+        for arrays, dataset in self.scopes:
+            if arrays[0] is x and arrays[1] is y:
+                self.dataset = dataset
+                return
+
+        self.dataset = fingerprint(x, y)
+        self.scopes.append(((x, y), self.dataset))
+
+
+    def get(self, key):
+        """Looks up an entry and records a hit or a miss.
+
+        # Arguments
+            key: The cache key as a string.
+
+        # Returns
+            A tuple containing the predictions and fitness, or None.
+        """
+        entry = self.entries.get((self.dataset, key))
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end((self.dataset, key))
+
+        return entry
+
+
+    def put(self, key, pred, fitness):
+        """Stores an entry, evicting the least recently used entries to stay
+        within the size limits.
+
+        # Arguments
+            key: The cache key as a string.
+            pred: A NumPy array of predictions.
+            fitness: The fitness as a float.
+
+        # Returns
+            None.
+        """
+        if not self.max_entries or (self.dataset, key) in self.entries:
+            return
+
+        pred = np.array(pred, dtype=np.float32)
+        self.entries[(self.dataset, key)] = (pred, fitness)
+        self.n_bytes += pred.nbytes
+
+        while self.entries and (len(self.entries) > self.max_entries or
+                                self.n_bytes > self.max_bytes):
+            self.n_bytes -= self.entries.popitem(last=False)[1][0].nbytes
+
+
+    def clear(self):
+        """Removes all entries.
+
+        # Returns
+            None.
+        """
+        self.entries.clear()
+        self.n_bytes = 0
+
+
+    def reset_counters(self):
+        """Resets the hit and miss counters.
+
+        # Returns
+            None.
+        """
+        self.hits = 0
+        self.misses = 0
+
+
+    def hit_rate(self):
+        """Returns the proportion of lookups served from the cache since the
+        counters were last reset.
+
+        # Returns
+            The hit rate as a float.
+        """
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+    def miss_rate(self):
+        """Returns the proportion of lookups that required evaluation since
+        the counters were last reset.
+
+        # Returns
+            The miss rate as a float.
+        """
+        return self.misses / max(self.hits + self.misses, 1)
+
+
+class StateCache:
+    """Least-recently-used cache mapping hashed program prefixes to the 
+    register states they leave for every sample. States are only valid for 
+    the input samples the cache is scoped to, and are discarded when the 
+    samples change.
+    """
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        """Initialises the StateCache object.
+
+        # Arguments
+            max_bytes: Maximum total size of stored states in bytes as an 
+                integer. Zero disables the cache.
+
+        # Returns
+            None.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.dataset = None
+        self.x = None
+
+
+    def scope(self, x):
+        """Scopes the cache to input samples, clearing it if they changed.
+
+        # Arguments
+            x: A NumPy array of input samples.
+
+        # Returns
+            None.
+        """
+        if self.x is x:
+            return
+
+        self.x = x
+        dataset = fingerprint(x)
+
+        if dataset != self.dataset:
+            self.clear()
+            self.dataset = dataset
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def get(self, key):
+        """Looks up a state and marks it as recently used.
+
+        # Arguments
+            key: The cache key as a string.
+
+        # Returns
+            A float32 NumPy array of shape (n_samples, n_registers), or None.
+        """
+        state = self.entries.get(key)
+
+        if state is not None:
+            self.entries.move_to_end(key)
+
+        return state
+
+
+    def put(self, key, state):
+        """Stores a state, evicting the least recently used states to stay 
+        within the size limit.
+
+        # Arguments
+            key: The cache key as a string.
+            state: A float32 NumPy array of shape (n_samples, n_registers).
+
+        # Returns
+            None.
+        """
+        if state.nbytes > self.max_bytes or key in self.entries:
+            return
+
+        self.entries[key] = state
+        self.n_bytes += state.nbytes
+
+        while self.n_bytes > self.max_bytes:
+            self.n_bytes -= self.entries.popitem(last=False)[1].nbytes
+
+
+    def clear(self):
+        """Removes all states.
+
+        # Returns
+            None.
+        """
+        self.entries.clear()
+        self.n_bytes = 0
@@ -0,0 +1,160 @@
+# checkpoint.py
+
+import os
+import random
+import uuid
+
+import numpy as np
+
+from deap import tools
+
+
+def pack_genomes(individuals):
+    """Concatenates the genomes of individuals into a single array.
+
+    # Arguments
+        individuals: A list of grape.Individual objects.
+
+    # Returns
+        A tuple containing the codons and the offset of each genome as NumPy
+        arrays.
+    """
+    lengths = [len(ind.genome) for ind in individuals]
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    codons = np.fromiter((codon for ind in individuals for codon in ind.genome),
+                         dtype=np.int64, count=offsets[-1])
+
+    if codons.size:
+        codons = codons.astype(np.min_scalar_type(codons.max()))
+
+    return codons, offsets
+
+
+def unpack_genomes(codons, offsets, fitness, ind_class, bnf_grammar,
+                   max_tree_depth, codon_consumption):
+    """Rebuilds individuals by mapping stored genomes with the grammar.
+
+    # Arguments
+        codons: A NumPy array of concatenated codons.
+        offsets: A NumPy array with the offset of each genome.
+        fitness: A NumPy array of fitness values.
+        ind_class: The individual class, e.g. creator.Individual.
+        bnf_grammar: A grape.Grammar object.
+        max_tree_depth: Maximum tree depth as an integer.
+        codon_consumption: A string indicating the codon consumption.
+
+    # Returns
+        A list of grape.Individual objects.
+    """
+    individuals = []
+    for i in range(len(offsets) - 1):
+        genome = codons[offsets[i]:offsets[i + 1]].tolist()
+        ind = ind_class(genome, bnf_grammar, max_tree_depth, codon_consumption)
+        ind.fitness.values = float(fitness[i]),
+        individuals.append(ind)
+
+    return individuals
+
+
+def save(path, population, hof, logbook, report_items, ngen, duration):
+    """Atomically writes a checkpoint of a run to a compressed NumPy archive.
+
+    # Arguments
+        path: A string containing the path of the checkpoint file.
+        population: A list of grape.Individual objects.
+        hof: A deap.tools.HallOfFame object.
+        logbook: A deap.tools.support.Logbook object.
+        report_items: A list of logbook items to store.
+        ngen: Number of completed generations as an integer.
+        duration: The execution time so far in seconds as a float.
+
+    # Returns
+        None.
+    """
+    codons, offsets = pack_genomes(population)
+    hof_codons, hof_offsets = pack_genomes(hof.items)
+
+    version, internal_state, gauss_next = random.getstate()
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+
+    arrays = {
+        'codons': codons,
+        'offsets': offsets,
+        'fitness': np.array([ind.fitness.values[0] for ind in population]),
+        'hof_codons': hof_codons,
+        'hof_offsets': hof_offsets,
+        'hof_fitness': np.array([ind.fitness.values[0] for ind in hof.items]),
+        'ngen': ngen,
+        'duration': duration,
+        'random_version': version,
+        'random_state': np.array(internal_state, dtype=np.uint32),
+        'random_gauss': np.nan if gauss_next is None else gauss_next,
+        'np_random_keys': keys,
+        'np_random_pos': pos,
+        'np_random_gauss': cached_gaussian if has_gauss else np.nan
+    }
+
+    for item in report_items:
+        column = np.array(logbook.select(item))
+        if column.dtype == object:
+            column = column.astype(np.float64)
+        arrays[f'logbook_{item}'] = column
+
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+    os.replace(tmp_path, path)
+
+
+def load(path, ind_class, bnf_grammar, max_tree_depth, codon_consumption,
+         hof_size, report_items):
+    """Reads a checkpoint and restores the random number generator states.
+
+    # Arguments
+        path: A string containing the path of the checkpoint file.
+        ind_class: The individual class, e.g. creator.Individual.
+        bnf_grammar: A grape.Grammar object.
+        max_tree_depth: Maximum tree depth as an integer.
+        codon_consumption: A string indicating the codon consumption.
+        hof_size: Hall-of-fame size as an integer.
+        report_items: A list of logbook items to restore.
+
+    # Returns
+        A dictionary containing the population, hall of fame, logbook,
+        number of completed generations and execution time so far.
+    """
+    with np.load(path) as data:
+        population = unpack_genomes(data['codons'], data['offsets'],
+                                    data['fitness'], ind_class, bnf_grammar,
+                                    max_tree_depth, codon_consumption)
+
+        hof = tools.HallOfFame(hof_size)
+        for ind in unpack_genomes(data['hof_codons'], data['hof_offsets'],
+                                  data['hof_fitness'], ind_class, bnf_grammar,
+                                  max_tree_depth, codon_consumption):
+            hof.insert(ind)
+
+        # Items that were not recorded in the checkpoint, such as phase 
+        # timings when profiling was off, are restored as None.
+        logbook = tools.Logbook()
+        n_records = len(data['logbook_gen'])
+        columns = [data[f'logbook_{item}'].tolist() if f'logbook_{item}' in data 
+                   else [None] * n_records for item in report_items]
+        for values in zip(*columns):
+            logbook.record(**dict(zip(report_items, values)))
+
+        gauss_next = float(data['random_gauss'])
+        random.setstate((int(data['random_version']),
+                         tuple(data['random_state'].tolist()),
+                         None if np.isnan(gauss_next) else gauss_next))
+
+        cached_gaussian = float(data['np_random_gauss'])
+        np.random.set_state(('MT19937', data['np_random_keys'],
+                             int(data['np_random_pos']),
+                             int(not np.isnan(cached_gaussian)),
+                             0.0 if np.isnan(cached_gaussian) else cached_gaussian))
+
+        return {'population': population, 'hof': hof, 'logbook': logbook,
+                'ngen': int(data['ngen']), 'duration': float(data['duration'])}
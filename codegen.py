@@ -4,12 +4,205 @@ import os
 import subprocess
 import tempfile
 import struct
+import time
+import ctypes
+import _ctypes
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
-# Uncomment for timing measurements
-# import time
+import ir
+import imagedata
+import interpreter
+import objcache
+import profiling
+import session
+import vectorised
+import worker
 
-def generate_code_gcc(x, expressions, n_registers):
+GCC_OBJECT_FLAGS = ['-c']
+
+COMPILE_PROFILES = {
+    'fast-compile': {'gcc': [],
+                     'nvcc': ['-use_fast_math', '-O0', '-Xptxas', '-O0', '-Xcicc', '-O0']},
+    'balanced': {'gcc': ['-O1'],
+                 'nvcc': ['-use_fast_math', '-O1', '-Xptxas', '-O1']},
+    'fast-run': {'gcc': ['-O3', '-ffast-math', '-march=native'],
+                 'nvcc': ['-use_fast_math', '-O3', '-Xptxas', '-O3']}
+}
+
+compile_profile = 'fast-compile'
+
+# Number of timings per profile before 'auto' mode chooses one.
+AUTO_TRIALS = 3
+
+# Backends whose results can depend on the compile profile.
+COMPILED = ('gcc', 'nvcc', 'nvcc-host')
+
+_auto_timings = {}
+
+MIN_SHARD_SIZE = 25
+
+compile_jobs = int(os.environ.get('GE_COMPILE_JOBS', os.cpu_count() or 1))
+
+nvcc_batched = True
+nvcc_block_size = 256
+nvcc_streams = 4
+
+PREDICT_CHUNK_SIZE = 2 ** 18
+
+
+def generate_function_gcc(expression, n_features, n_registers, name):
+    """Generates a C function that evaluates a single individual.
+
+    # Arguments
+        expression: A string containing the code expression for an individual.
+        n_features: Number of input features as an integer.
+        n_registers: Number of registers as an integer.
+        name: A string containing the name of the function.
+    
+    # Returns
+        A string containing the C function definition.
+    """
+    indented_expression = '\n'.join([f'\t{line}' for line in expression.splitlines()])
+
+    return (f'float {name}(float x[{n_features}])\n'
+            '{\n'
+            f'\tfloat r[{n_registers}];\n\n'
+            f'\tfor (int i = 0; i < {n_registers}; i++) r[i] = x[i % {n_features}];\n\n'
+            f'{indented_expression}\n\n'
+            f'\treturn r[0];\n'
+            '}\n')
+
+
+def split_shards(items, n_shards):
+    """Splits a list into at most n_shards contiguous shards of similar size.
+
+    # Arguments
+        items: A list of items.
+        n_shards: Maximum number of shards as an integer.
+    
+    # Returns
+        A list of non-empty lists.
+    """
+    n_shards = max(min(n_shards, len(items)), 1)
+    size, remainder = divmod(len(items), n_shards)
+
+    shards = []
+    start = 0
+    for k in range(n_shards):
+        end = start + size + (k < remainder)
+        shards.append(items[start:end])
+        start = end
+
+    return [shard for shard in shards if shard]
+
+
+def run_parallel(commands, cwd):
+    """Runs compiler commands concurrently, at most compile_jobs at a time, 
+    raising subprocess.CalledProcessError if any of them fails.
+
+    # Arguments
+        commands: A list of commands, each a list of strings.
+        cwd: A string containing the working directory.
+    
+    # Returns
+        None.
+    """
+    with ThreadPoolExecutor(max_workers=max(compile_jobs, 1)) as executor:
+        list(executor.map(lambda command: subprocess.run(command, cwd=cwd, check=True), commands))
+
+
+def compile_sharded_gcc(x, expressions, n_registers, tmpdirname, executable_path, 
+                        flags=()):
+    """Compiles a GCC program by splitting the population into several 
+    translation units that are compiled concurrently and then linked.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        expressions: A list of strings containing code expressions for 
+            individuals in the population.
+        n_registers: Number of registers as an integer.
+        tmpdirname: A string containing the path for the scratch directory.
+        executable_path: A string containing the path for the executable.
+        flags: A sequence of additional compiler flags.
+    
+    # Returns
+        None.
+    """
+    names = [f'evaluate{i}' for i in range(len(expressions))]
+    n_shards = min(compile_jobs, len(expressions) // MIN_SHARD_SIZE)
+
+    sources = []
+    for k, shard in enumerate(split_shards(list(zip(names, expressions)), n_shards)):
+        evaluate = ''.join([generate_function_gcc(expression, x.shape[1], n_registers, name) 
+                            for name, expression in shard])
+        
+        sources.append(f'shard{k}.c')
+        with open(os.path.join(tmpdirname, sources[-1]), 'w') as f:
+            f.write('#include <math.h>\n\n' + evaluate)
+
+    run_parallel([['gcc', *GCC_OBJECT_FLAGS, *flags, source] for source in sources], tmpdirname)
+
+    program_path = os.path.join(tmpdirname, 'program.c')
+    with open(program_path, 'w') as f:
+        f.write(generate_code_gcc(x, [], n_registers, names))
+
+    objects = [os.path.join(tmpdirname, f'{os.path.splitext(source)[0]}.o') for source in sources]
+    subprocess.run(['gcc', program_path, *objects, '-o', executable_path, *flags, '-lm'], check=True)
+
+
+def compile_cached_gcc(x, expressions, n_registers, tmpdirname, executable_path, 
+                       flags=()):
+    """Compiles a GCC program from per-individual object files, reusing 
+    objects from the persistent object cache and adding any that are missing.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        expressions: A list of strings containing code expressions for 
+            individuals in the population.
+        n_registers: Number of registers as an integer.
+        tmpdirname: A string containing the path for the scratch directory.
+        executable_path: A string containing the path for the executable.
+        flags: A sequence of additional compiler flags.
+    
+    # Returns
+        None.
+    """
+    names = []
+    missing = {}
+    for expression in expressions:
+        function = generate_function_gcc(expression, x.shape[1], n_registers, 'evaluate')
+        key = objcache.key(function, [*GCC_OBJECT_FLAGS, *flags])
+        name = f'evaluate_{key}'
+        names.append(name)
+
+        object_path = os.path.join(tmpdirname, f'{name}.o')
+        if name in missing or os.path.exists(object_path) or objcache.fetch(key, object_path):
+            continue
+
+        missing[name] = key
+        with open(os.path.join(tmpdirname, f'{name}.c'), 'w') as f:
+            f.write('#include <math.h>\n\n' + generate_function_gcc(expression, x.shape[1], n_registers, name))
+
+    if missing:
+        sources = [f'{name}.c' for name in missing]
+        run_parallel([['gcc', *GCC_OBJECT_FLAGS, *flags, *shard] 
+                      for shard in split_shards(sources, compile_jobs)], tmpdirname)
+
+        for name, key in missing.items():
+            objcache.store(key, os.path.join(tmpdirname, f'{name}.o'))
+        
+        objcache.evict()
+
+    program_path = os.path.join(tmpdirname, 'program.c')
+    with open(program_path, 'w') as f:
+        f.write(generate_code_gcc(x, [], n_registers, names))
+
+    objects = [os.path.join(tmpdirname, f'{name}.o') for name in dict.fromkeys(names)]
+    subprocess.run(['gcc', program_path, *objects, '-o', executable_path, *flags, '-lm'], check=True)
+
+
+def generate_code_gcc(x, expressions, n_registers, names=None):
     """Generates content for a C code file for compilation with GCC.
 
     # Arguments
@@ -17,6 +210,8 @@ def generate_code_gcc(x, expressions, n_registers):
         expressions: A list of strings containing code expressions for 
             individuals in the population.
         n_registers: Number of registers as an integer.
+        names: A list of strings containing the names of separately compiled 
+            evaluation functions to call instead of the expressions, or None.
     
     # Returns
         A string containing contents for a C source code file.
@@ -41,30 +236,23 @@ def generate_code_gcc(x, expressions, n_registers):
                   '}\n')
 
     evaluate = ''
-    for i, expression in enumerate(expressions):
-        indented_expression = '\n'.join([f'\t{line}' for line in expression.splitlines()])
-
-        evaluate += (f'float evaluate{i}(float x[{x.shape[1]}])\n'
-                     '{\n'
-                     f'\tfloat r[{n_registers}];\n\n'
-                     f'\tfor (int i = 0; i < {n_registers}; i++) r[i] = x[i % {x.shape[1]}];\n\n'
-                     f'{indented_expression}\n\n'
-                     f'\treturn r[0];\n'
-                     '}\n')
+    if names is None:
+        names = [f'evaluate{i}' for i in range(len(expressions))]
+        for name, expression in zip(names, expressions):
+            evaluate += generate_function_gcc(expression, x.shape[1], n_registers, name)
+    else:
+        for name in dict.fromkeys(names):
+            evaluate += f'float {name}(float *x);\n'
 
-    subarrays = []
-    for row in x:
-        subarrays.append(''.join(['{', ', '.join([str(val) for val in row.tolist()]), '}']))
-    
     pred = ''
-    for i in range(len(expressions)):
-        pred += f'\t\tpred[{x.shape[0]} * {i} + i] = evaluate{i}(&x[{x.shape[1]} * i]);\n'
+    for i, name in enumerate(names):
+        pred += f'\t\tpred[{x.shape[0]} * {i} + i] = {name}(&x[{x.shape[1]} * i]);\n'
 
     main = (f'int main(int argc, char *argv[])\n'
             '{\n'
             '\tfloat *x, *pred;\n\n'
             f'\tx = (float *)malloc({x.shape[0]} * {x.shape[1]} * sizeof(float));\n'
-            f'\tpred = (float *)malloc({len(expressions)} * {x.shape[0]} * sizeof(float));\n\n'
+            f'\tpred = (float *)malloc({len(names)} * {x.shape[0]} * sizeof(float));\n\n'
             '\tif (argc > 1)\n'
             '\t{\n'
             f'\t\tread_data(argv[1], (float *)x, {x.shape[0]} * {x.shape[1]});\n'
@@ -75,7 +263,7 @@ def generate_code_gcc(x, expressions, n_registers):
             '\t}\n\n'
             '\tif (argc > 2)\n'
             '\t{\n'
-            f'\t\twrite_data(argv[2], (float *)pred, {len(expressions)} * {x.shape[0]});\n'
+            f'\t\twrite_data(argv[2], (float *)pred, {len(names)} * {x.shape[0]});\n'
             '\t}\n\n'
             '\tfree(x);\n'
             '\tfree(pred);\n\n'
@@ -85,6 +273,68 @@ def generate_code_gcc(x, expressions, n_registers):
     return '\n'.join([include, read_data, write_data, evaluate, main])
 
 
+def generate_library_gcc(n_features, expressions, n_registers):
+    """Generates content for a C code file to be compiled into a shared 
+    library and loaded into a running process.
+
+    # Arguments
+        n_features: Number of input features as an integer.
+        expressions: A list of strings containing code expressions for 
+            individuals in the population.
+        n_registers: Number of registers as an integer.
+    
+    # Returns
+        A string containing contents for a C source code file.
+    """
+    include = '#include <math.h>\n'
+
+    evaluate = ''
+    pred = ''
+    for i, expression in enumerate(expressions):
+        evaluate += generate_function_gcc(expression, n_features, n_registers, f'evaluate{i}')
+        pred += f'\t\tpred[n_samples * {i} + i] = evaluate{i}(&x[{n_features} * i]);\n'
+
+    evaluate_population = ('void evaluate_population(float *x, long n_samples, float *pred)\n'
+                           '{\n'
+                           '\tfor (long i = 0; i < n_samples; i++)\n'
+                           '\t{\n'
+                           f'{pred}'
+                           '\t}\n'
+                           '}\n')
+
+    return '\n'.join([include, evaluate, evaluate_population])
+
+
+def load_library_gcc(source, tmpdirname, flags=()):
+    """Compiles C source produced by generate_library_gcc into a shared 
+    library and loads it into the current process.
+
+    # Arguments
+        source: A string containing the C source code.
+        tmpdirname: A string containing the path for the scratch directory.
+        flags: A sequence of additional compiler flags.
+    
+    # Returns
+        A ctypes.CDLL object. Unload it with _ctypes.dlclose when done.
+    """
+    source_path = os.path.join(tmpdirname, 'program.c')
+    library_path = os.path.join(tmpdirname, 'program.so')
+
+    with open(source_path, 'w') as f:
+        f.write(source)
+
+    subprocess.run(['gcc', source_path, '-o', library_path, '-shared',
+                    '-fPIC', *flags, '-lm'], check=True)
+
+    library = ctypes.CDLL(library_path)
+
+    floats = np.ctypeslib.ndpointer(dtype=np.float32, flags='C_CONTIGUOUS')
+    library.evaluate_population.restype = None
+    library.evaluate_population.argtypes = [floats, ctypes.c_long, floats]
+
+    return library
+
+
 def generate_code_nvcc(x, expressions, n_registers):
     """Generates content for a CUDA code file for compilation with NVCC.
 
@@ -132,10 +382,6 @@ def generate_code_nvcc(x, expressions, n_registers):
                      f'\tpred[tid] = r[0];\n'
                      '}\n')
     
-    subarrays = []
-    for row in x:
-        subarrays.append(''.join(['{', ', '.join([str(val) for val in row.tolist()]), '}']))
-    
     launch_kernels = ''
     for i in range(len(expressions)):
         launch_kernels += f'\tevaluate{i}<<<(({x.shape[0]} + 255) / 256), 256>>>(d_x, d_pred);\n'
@@ -168,86 +414,643 @@ def generate_code_nvcc(x, expressions, n_registers):
     return '\n'.join([include, read_data, write_data, evaluate, main])
 
 
-def run_program(x, expressions, compiler, n_registers):
-    """Performs steps relating to generation of C or CUDA code including 
-    generation, compilation, and execution of the program.
+def generate_code_nvcc_batched(x, expressions, n_registers, block_size=256, 
+                               n_streams=4):
+    """Generates content for a CUDA code file that evaluates the whole 
+    population in a single kernel launch over a 2D grid of sample blocks and 
+    individuals. Samples are split across streams so that transfers overlap 
+    with computation. When compiled without NVCC, the same file runs the 
+    grid sequentially on the host, which allows it to be checked against the 
+    GCC backend on machines without a GPU.
 
     # Arguments
         x: A NumPy array of input samples.
         expressions: A list of strings containing code expressions for 
             individuals in the population.
+        n_registers: Number of registers as an integer.
+        block_size: Number of threads per block as an integer.
+        n_streams: Number of CUDA streams as an integer.
+    
+    # Returns
+        A string containing contents for a CUDA source code file.
+    """
+    n_samples, n_features = x.shape
+
+    include = ('#ifdef __CUDACC__\n'
+               '#include "cuda_runtime.h"\n'
+               '#include "device_launch_parameters.h"\n'
+               '#else\n'
+               '#define __device__\n'
+               '#endif\n'
+               '#include <math.h>\n'
+               '#include <stdio.h>\n'
+               '#include <stdlib.h>\n')
+
+    read_data = ('void read_data(char *filename, float *data, size_t size)\n'
+                '{\n'
+                '\tFILE *file = fopen(filename, "rb");\n'
+                '\tfread(data, sizeof(float), size, file);\n'
+                '\tfclose(file);\n'
+                '}\n')
+
+    write_data = ('void write_data(char *filename, float *data, size_t size)\n'
+                  '{\n'
+                  '\tFILE *file = fopen(filename, "wb");\n'
+                  '\tfwrite(data, sizeof(float), size, file);\n'
+                  '\tfclose(file);\n'
+                  '}\n')
+
+    evaluate = ''
+    cases = ''
+    for i, expression in enumerate(expressions):
+        evaluate += '__device__ ' + generate_function_gcc(expression, n_features, n_registers, f'evaluate{i}')
+        cases += f'\tcase {i}: return evaluate{i}(x);\n'
+
+    dispatch = ('__device__ float evaluate_individual(int individual, float *x)\n'
+                '{\n'
+                '\tswitch (individual)\n'
+                '\t{\n'
+                f'{cases}'
+                '\t}\n'
+                '\treturn 0;\n'
+                '}\n')
+
+    kernel = ('#ifdef __CUDACC__\n'
+              '__global__\n'
+              'void evaluate_population(float *x, float *pred, int start, int end)\n'
+              '{\n'
+              '\tint tid = start + blockIdx.x * blockDim.x + threadIdx.x;\n'
+              '\tif (tid >= end) return;\n\n'
+              f'\tpred[(size_t){n_samples} * blockIdx.y + tid] = evaluate_individual(blockIdx.y, &x[(size_t){n_features} * tid]);\n'
+              '}\n'
+              '#endif\n')
+
+    main = (f'int main(int argc, char *argv[])\n'
+            '{\n'
+            '\tfloat *x, *pred;\n\n'
+            '#ifdef __CUDACC__\n'
+            f'\tcudaMallocHost(&x, (size_t){n_samples} * {n_features} * sizeof(float));\n'
+            f'\tcudaMallocHost(&pred, (size_t){len(expressions)} * {n_samples} * sizeof(float));\n'
+            '#else\n'
+            f'\tx = (float *)malloc((size_t){n_samples} * {n_features} * sizeof(float));\n'
+            f'\tpred = (float *)malloc((size_t){len(expressions)} * {n_samples} * sizeof(float));\n'
+            '#endif\n\n'
+            '\tif (argc > 1)\n'
+            '\t{\n'
+            f'\t\tread_data(argv[1], (float *)x, (size_t){n_samples} * {n_features});\n'
+            '\t}\n\n'
+            '#ifdef __CUDACC__\n'
+            '\tfloat *d_x, *d_pred;\n'
+            f'\tcudaStream_t streams[{n_streams}];\n'
+            f'\tint chunk = ({n_samples} + {n_streams} - 1) / {n_streams};\n\n'
+            f'\tcudaMalloc(&d_x, (size_t){n_samples} * {n_features} * sizeof(float));\n'
+            f'\tcudaMalloc(&d_pred, (size_t){len(expressions)} * {n_samples} * sizeof(float));\n\n'
+            f'\tfor (int s = 0; s < {n_streams}; s++)\n'
+            '\t{\n'
+            '\t\tint start = s * chunk;\n'
+            f'\t\tint end = start + chunk < {n_samples} ? start + chunk : {n_samples};\n\n'
+            '\t\tcudaStreamCreate(&streams[s]);\n'
+            '\t\tif (start >= end) continue;\n\n'
+            f'\t\tcudaMemcpyAsync(d_x + (size_t){n_features} * start, x + (size_t){n_features} * start, (size_t){n_features} * (end - start) * sizeof(float), cudaMemcpyHostToDevice, streams[s]);\n'
+            f'\t\tevaluate_population<<<dim3((end - start + {block_size - 1}) / {block_size}, {len(expressions)}), {block_size}, 0, streams[s]>>>(d_x, d_pred, start, end);\n'
+            f'\t\tcudaMemcpy2DAsync(pred + start, {n_samples} * sizeof(float), d_pred + start, {n_samples} * sizeof(float), (end - start) * sizeof(float), {len(expressions)}, cudaMemcpyDeviceToHost, streams[s]);\n'
+            '\t}\n\n'
+            '\tcudaDeviceSynchronize();\n\n'
+            f'\tfor (int s = 0; s < {n_streams}; s++) cudaStreamDestroy(streams[s]);\n\n'
+            '\tcudaFree(d_x);\n'
+            '\tcudaFree(d_pred);\n'
+            '#else\n'
+            f'\tfor (int individual = 0; individual < {len(expressions)}; individual++)\n'
+            '\t{\n'
+            f'\t\tfor (int tid = 0; tid < {n_samples}; tid++)\n'
+            '\t\t{\n'
+            f'\t\t\tpred[(size_t){n_samples} * individual + tid] = evaluate_individual(individual, &x[(size_t){n_features} * tid]);\n'
+            '\t\t}\n'
+            '\t}\n'
+            '#endif\n\n'
+            '\tif (argc > 2)\n'
+            '\t{\n'
+            f'\t\twrite_data(argv[2], (float *)pred, (size_t){len(expressions)} * {n_samples});\n'
+            '\t}\n\n'
+            '#ifdef __CUDACC__\n'
+            '\tcudaFreeHost(x);\n'
+            '\tcudaFreeHost(pred);\n'
+            '#else\n'
+            '\tfree(x);\n'
+            '\tfree(pred);\n'
+            '#endif\n\n'
+            '\treturn 0;\n'
+            '}\n')
+
+    return '\n'.join([include, read_data, write_data, evaluate, dispatch, kernel, main])
+
+
+def generate_function_images(program, x, n_registers, name):
+    """Generates a C function that evaluates a single individual on an 
+    image-native sample, reading each feature x[j] from the sample's window 
+    in the image.
+
+    # Arguments
+        program: An ir.Program object or a string containing the code 
+            expression for an individual.
+        x: An imagedata.WindowedImages object.
+        n_registers: Number of registers as an integer.
+        name: A string containing the name of the function.
+    
+    # Returns
+        A string containing the C function definition.
+    """
+    window_offsets = x.window_offsets()
+
+    def lookup(j):
+        return f'scale[p[{window_offsets[j]}]]'
+    
+    expression = ir.emit_c(ir.as_program(program), lookup)
+    indented_expression = '\n'.join([f'\t{line}' for line in expression.splitlines()])
+
+    init = ''.join([f'\tr[{i}] = {lookup(i % x.shape[1])};\n' for i in range(n_registers)])
+
+    return (f'float {name}(const unsigned char *p)\n'
+            '{\n'
+            f'\tfloat r[{n_registers}];\n\n'
+            f'{init}\n'
+            f'{indented_expression}\n\n'
+            f'\treturn r[0];\n'
+            '}\n')
+
+
+def generate_code_images(x, programs, n_registers, block_size=256):
+    """Generates content for a CUDA code file that evaluates the population 
+    on image-native samples. Only the images and one window offset per 
+    sample are read, and window features are looked up at run time. When 
+    compiled without NVCC, the same file runs on the host.
+
+    # Arguments
+        x: An imagedata.WindowedImages object.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        n_registers: Number of registers as an integer.
+        block_size: Number of threads per block as an integer.
+    
+    # Returns
+        A string containing contents for a CUDA source code file.
+    """
+    n_samples = x.shape[0]
+    n_pixels = x.images.size
+
+    include = ('#ifdef __CUDACC__\n'
+               '#include "cuda_runtime.h"\n'
+               '#include "device_launch_parameters.h"\n'
+               '#else\n'
+               '#define __device__\n'
+               '#endif\n'
+               '#include <math.h>\n'
+               '#include <stdio.h>\n'
+               '#include <stdlib.h>\n')
+
+    values = ', '.join([f'{np.format_float_positional(value, unique=True)}f' 
+                        for value in imagedata.SCALE])
+    
+    scale = ('#ifdef __CUDACC__\n'
+             '__constant__\n'
+             '#else\n'
+             'static const\n'
+             '#endif\n'
+             f'float scale[256] = {{{values}}};\n')
+
+    read_data = ('void read_data(char *filename, void *data, size_t size, size_t count)\n'
+                '{\n'
+                '\tFILE *file = fopen(filename, "rb");\n'
+                '\tfread(data, size, count, file);\n'
+                '\tfclose(file);\n'
+                '}\n')
+
+    write_data = ('void write_data(char *filename, float *data, size_t size)\n'
+                  '{\n'
+                  '\tFILE *file = fopen(filename, "wb");\n'
+                  '\tfwrite(data, sizeof(float), size, file);\n'
+                  '\tfclose(file);\n'
+                  '}\n')
+
+    evaluate = ''
+    cases = ''
+    for i, program in enumerate(programs):
+        evaluate += '__device__ ' + generate_function_images(program, x, n_registers, f'evaluate{i}')
+        cases += f'\tcase {i}: return evaluate{i}(p);\n'
+
+    dispatch = ('__device__ float evaluate_individual(int individual, const unsigned char *p)\n'
+                '{\n'
+                '\tswitch (individual)\n'
+                '\t{\n'
+                f'{cases}'
+                '\t}\n'
+                '\treturn 0;\n'
+                '}\n')
+
+    kernel = ('#ifdef __CUDACC__\n'
+              '__global__\n'
+              'void evaluate_population(const unsigned char *images, const unsigned int *offsets, float *pred)\n'
+              '{\n'
+              '\tint tid = blockIdx.x * blockDim.x + threadIdx.x;\n'
+              f'\tif (tid >= {n_samples}) return;\n\n'
+              f'\tpred[(size_t){n_samples} * blockIdx.y + tid] = evaluate_individual(blockIdx.y, images + offsets[tid]);\n'
+              '}\n'
+              '#endif\n')
+
+    main = (f'int main(int argc, char *argv[])\n'
+            '{\n'
+            '\tunsigned char *images;\n'
+            '\tunsigned int *offsets;\n'
+            '\tfloat *pred;\n\n'
+            f'\timages = (unsigned char *)malloc((size_t){n_pixels});\n'
+            f'\toffsets = (unsigned int *)malloc((size_t){n_samples} * sizeof(unsigned int));\n'
+            f'\tpred = (float *)malloc((size_t){len(programs)} * {n_samples} * sizeof(float));\n\n'
+            '\tif (argc > 2)\n'
+            '\t{\n'
+            f'\t\tread_data(argv[1], images, 1, (size_t){n_pixels});\n'
+            f'\t\tread_data(argv[2], offsets, sizeof(unsigned int), (size_t){n_samples});\n'
+            '\t}\n\n'
+            '#ifdef __CUDACC__\n'
+            '\tunsigned char *d_images;\n'
+            '\tunsigned int *d_offsets;\n'
+            '\tfloat *d_pred;\n\n'
+            f'\tcudaMalloc(&d_images, (size_t){n_pixels});\n'
+            f'\tcudaMalloc(&d_offsets, (size_t){n_samples} * sizeof(unsigned int));\n'
+            f'\tcudaMalloc(&d_pred, (size_t){len(programs)} * {n_samples} * sizeof(float));\n\n'
+            f'\tcudaMemcpy(d_images, images, (size_t){n_pixels}, cudaMemcpyHostToDevice);\n'
+            f'\tcudaMemcpy(d_offsets, offsets, (size_t){n_samples} * sizeof(unsigned int), cudaMemcpyHostToDevice);\n\n'
+            f'\tevaluate_population<<<dim3(({n_samples} + {block_size - 1}) / {block_size}, {len(programs)}), {block_size}>>>(d_images, d_offsets, d_pred);\n\n'
+            f'\tcudaMemcpy(pred, d_pred, (size_t){len(programs)} * {n_samples} * sizeof(float), cudaMemcpyDeviceToHost);\n\n'
+            '\tcudaFree(d_images);\n'
+            '\tcudaFree(d_offsets);\n'
+            '\tcudaFree(d_pred);\n'
+            '#else\n'
+            f'\tfor (int individual = 0; individual < {len(programs)}; individual++)\n'
+            '\t{\n'
+            f'\t\tfor (int tid = 0; tid < {n_samples}; tid++)\n'
+            '\t\t{\n'
+            f'\t\t\tpred[(size_t){n_samples} * individual + tid] = evaluate_individual(individual, images + offsets[tid]);\n'
+            '\t\t}\n'
+            '\t}\n'
+            '#endif\n\n'
+            '\tif (argc > 3)\n'
+            '\t{\n'
+            f'\t\twrite_data(argv[3], pred, (size_t){len(programs)} * {n_samples});\n'
+            '\t}\n\n'
+            '\tfree(images);\n'
+            '\tfree(offsets);\n'
+            '\tfree(pred);\n\n'
+            '\treturn 0;\n'
+            '}\n')
+
+    return '\n'.join([include, scale, read_data, write_data, evaluate, dispatch, kernel, main])
+
+
+def run_program_images(data, programs, compiler, n_registers):
+    """Compiles and runs a program that evaluates programs on 
+    image-native samples.
+
+    # Arguments
+        data: A session.ImageSession object.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        compiler: A string indicating the compiler to use. 'gcc' and 
+            'nvcc-host' compile the program for the host with GCC.
+        n_registers: Number of registers as an integer.
+    
+    # Returns
+        A float32 NumPy array of predictions.
+    """
+    x = data.x
+
+    profile = resolve_profile(compiler, x.shape[0])
+    flags = compile_flags(compiler, profile)
+    profile_start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        program_path = os.path.join(tmpdirname, 'program.cu')
+        executable_path = os.path.join(tmpdirname, 'executable')
+        data_path = os.path.join(tmpdirname, 'data.bin')
+
+        with profiling.phase('codegen'):
+            code = generate_code_images(x, programs, n_registers, nvcc_block_size)
+
+        with profiling.phase('write_source'):
+            with open(program_path, 'w') as f:
+                f.write(code)
+
+        if compiler == 'nvcc':
+            compile_command = ['nvcc', program_path, '-o', executable_path, *flags]
+        else:
+            compile_command = ['gcc', '-x', 'c', program_path, '-x', 'none', '-o', executable_path, *flags, '-lm']
+
+        with profiling.phase('compile'):
+            subprocess.run(compile_command, check=True)
+
+        with profiling.phase('execute'):
+            subprocess.run([executable_path, data.images_path, data.offsets_path, data_path], check=True)
+
+        record_profile_timing(compiler, x.shape[0], profile, 
+                              time.perf_counter() - profile_start, len(programs))
+
+        with profiling.phase('read_output'):
+            pred = np.fromfile(data_path, dtype=np.float32)
+
+    return pred.reshape((len(programs), x.shape[0]))
+
+
+def check_nvcc(x, programs, n_registers):
+    """Compiles the batched CUDA program for the host with GCC and compares 
+    its predictions with those of the GCC backend.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of strings containing code programs for 
+            individuals in the population.
+        n_registers: Number of registers as an integer.
+    
+    # Returns
+        A boolean indicating whether the predictions are identical.
+    """
+    return np.array_equal(run_program(x, programs, 'nvcc-host', n_registers),
+                          run_program(x, programs, 'gcc', n_registers),
+                          equal_nan=True)
+
+
+def set_compile_profile(profile):
+    """Sets the compile profile used for generated code.
+
+    # Arguments
+        profile: A string with the name of a profile in COMPILE_PROFILES, or 
+            'auto' to time each profile and then keep the fastest.
+    
+    # Returns
+        None.
+    """
+    global compile_profile
+
+    if profile != 'auto' and profile not in COMPILE_PROFILES:
+        raise ValueError(f'Unknown compile profile: {profile}')
+
+    compile_profile = profile
+
+
+def resolve_profile(compiler, n_samples):
+    """Chooses the compile profile for the next compilation. In 'auto' mode 
+    the profiles take turns until each has been timed AUTO_TRIALS times for 
+    the compiler and dataset size, after which the profile with the lowest 
+    median compile and execution time per individual is used.
+
+    # Arguments
+        compiler: A string indicating the compiler to use.
+        n_samples: Number of samples as an integer.
+    
+    # Returns
+        A string with the name of the profile.
+    """
+    if compile_profile != 'auto':
+        return compile_profile
+
+    timings = _auto_timings.setdefault((compiler, n_samples), {})
+
+    for trial in range(AUTO_TRIALS):
+        for profile in COMPILE_PROFILES:
+            if len(timings.get(profile, ())) <= trial:
+                return profile
+
+    return min(timings, key=lambda profile: np.median(timings[profile]))
+
+
+def record_profile_timing(compiler, n_samples, profile, duration, n_programs):
+    """Records the compile and execution time of a profile for 'auto' mode.
+
+    # Arguments
+        compiler: A string indicating the compiler to use.
+        n_samples: Number of samples as an integer.
+        profile: A string with the name of the profile.
+        duration: The compile and execution time in seconds as a float.
+        n_programs: Number of programs as an integer.
+    
+    # Returns
+        None.
+    """
+    if compile_profile == 'auto':
+        timings = _auto_timings.setdefault((compiler, n_samples), {})
+        timings.setdefault(profile, []).append(duration / max(n_programs, 1))
+
+
+def compile_flags(compiler, profile):
+    """Returns the compiler flags for a compile profile.
+
+    # Arguments
         compiler: A string indicating the compiler to use.
+        profile: A string with the name of the profile.
+    
+    # Returns
+        A list of compiler flags.
+    """
+    return COMPILE_PROFILES[profile]['nvcc' if compiler == 'nvcc' else 'gcc']
+
+
+def run_program(x, programs, compiler, n_registers):
+    """Performs steps relating to generation of C or CUDA code including 
+    generation, compilation, and execution of the program.
+
+    # Arguments
+        x: A NumPy array of input samples, an imagedata.WindowedImages 
+            object or a session object. Inputs are staged once per session 
+            and reused across calls. Image-native samples are evaluated from 
+            the images by the compiled backends, and other backends use 
+            window features materialised once per session.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        compiler: A string indicating the compiler to use, 'interpreter' to 
+            use the precompiled register-machine interpreter, or 'numpy' to 
+            use the vectorised NumPy evaluator. 'nvcc-host' compiles the 
+            batched CUDA program for the host with GCC.
         n_registers: Number of registers as an integer.
     
     # Returns
         A NumPy array of floating-point values with predictions.
     """
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        input_path = os.path.join(tmpdirname, 'input.bin')
-        file_content = x.astype('f').tobytes()
+    with profiling.phase('write_input'):
+        data = session.get(x)
 
-        # Uncomment for timing measurements
-        # start_time = time.time()
+    if isinstance(data, session.ImageSession):
+        if compiler in ('gcc', 'nvcc', 'nvcc-host'):
+            return run_program_images(data, programs, compiler, n_registers)
+        
+        with profiling.phase('write_input'):
+            data = session.get(data.windows)
 
-        with open(input_path, "wb") as f:
-            f.write(file_content)
+    x = data.x
 
-        # Uncomment for timing measurements
-        # duration = time.time() - start_time
-        # print(f'\nWriting input: {duration:.6f}s', end=' | ')
+    if worker.enabled and compiler in worker.COMPILERS:
+        with profiling.phase('execute'):
+            return worker.run_program(data, programs, compiler, n_registers)
 
-        if compiler == 'gcc':
-            code = generate_code_gcc(x, expressions, n_registers)
-            program_path = os.path.join(tmpdirname, 'program.c')
-        elif compiler == 'nvcc':
-            code = generate_code_nvcc(x, expressions, n_registers)
-            program_path = os.path.join(tmpdirname, 'program.cu')
+    if compiler == 'interpreter':
+        with profiling.phase('execute'):
+            return interpreter.run_program(x, programs, n_registers)
+    elif compiler == 'numpy':
+        with profiling.phase('execute'):
+            return vectorised.run_program(x, programs, n_registers)
 
-        # Uncomment for timing measurements
-        # start_time = time.time()
+    with profiling.phase('codegen'):
+        expressions = [ir.as_expression(program) for program in programs]
 
-        with open(program_path, 'w') as f:
-            f.write(code)
+    profile = resolve_profile(compiler, x.shape[0])
+    flags = compile_flags(compiler, profile)
+    profile_start = time.perf_counter()
 
-        # Uncomment for timing measurements
-        # duration = time.time() - start_time
-        # print(f'Writing program: {duration:.6f}s', end=' | ')
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        input_path = data.input_path
 
         executable_path = os.path.join(tmpdirname, 'executable')
 
-        if compiler == 'gcc':
-            compile_command = ['gcc', program_path, '-o', executable_path, '-lm']
-        elif compiler == 'nvcc':
-            compile_command = ['nvcc', program_path, '-o', executable_path, '-use_fast_math', '-O0',  '-Xptxas', '-O0', '-Xcicc', '-O0']
-        
-        # Uncomment for timing measurements
-        # start_time = time.time()
+        if compiler == 'gcc' and objcache.directory:
+            with profiling.phase('compile'):
+                compile_cached_gcc(x, expressions, n_registers, tmpdirname, executable_path, flags)
+        elif compiler == 'gcc' and min(compile_jobs, len(expressions) // MIN_SHARD_SIZE) > 1:
+            with profiling.phase('compile'):
+                compile_sharded_gcc(x, expressions, n_registers, tmpdirname, executable_path, flags)
+        else:
+            with profiling.phase('codegen'):
+                if compiler == 'gcc':
+                    code = generate_code_gcc(x, expressions, n_registers)
+                    program_path = os.path.join(tmpdirname, 'program.c')
+                elif compiler == 'nvcc' and not nvcc_batched:
+                    code = generate_code_nvcc(x, expressions, n_registers)
+                    program_path = os.path.join(tmpdirname, 'program.cu')
+                elif compiler in ('nvcc', 'nvcc-host'):
+                    code = generate_code_nvcc_batched(x, expressions, n_registers, 
+                                                      nvcc_block_size, nvcc_streams)
+                    program_path = os.path.join(tmpdirname, 'program.cu')
 
-        subprocess.run(compile_command)
+            with profiling.phase('write_source'):
+                with open(program_path, 'w') as f:
+                    f.write(code)
 
-        # Uncomment for timing measurements
-        # duration = time.time() - start_time
-        # print(f'Compilation: {duration:.6f}s', end=' | ')
+            if compiler == 'gcc':
+                compile_command = ['gcc', program_path, '-o', executable_path, *flags, '-lm']
+            elif compiler == 'nvcc':
+                compile_command = ['nvcc', program_path, '-o', executable_path, *flags]
+            elif compiler == 'nvcc-host':
+                compile_command = ['gcc', '-x', 'c', program_path, '-x', 'none', '-o', executable_path, *flags, '-lm']
+
+            with profiling.phase('compile'):
+                subprocess.run(compile_command, check=True)
 
         data_path = os.path.join(tmpdirname, 'data.bin')
 
-        # Uncomment for timing measurements
-        # start_time = time.time()
+        with profiling.phase('execute'):
+            subprocess.run([executable_path, input_path, data_path], check=True)
+
+        record_profile_timing(compiler, x.shape[0], profile, 
+                              time.perf_counter() - profile_start, len(programs))
+
+        with profiling.phase('read_output'):
+            with open(data_path, "rb") as f:
+                file_content = f.read()
+                array = struct.unpack(f'{len(file_content) // struct.calcsize("f")}f', 
+                                      file_content)
+
+            pred = np.array(array).reshape((len(programs), x.shape[0]))
+
+    return pred
 
-        subprocess.run([executable_path, input_path, data_path])
 
-        # Uncomment for timing measurements
-        # duration = time.time() - start_time
-        # print(f'Execution: {duration:.6f}s', end=' | ')
-        # start_time = time.time()
+def run_program_chunked(x, programs, compiler, n_registers, 
+                        chunk_size=PREDICT_CHUNK_SIZE):
+    """Evaluates programs over consecutive chunks of samples. The 
+    programs are compiled or assembled once and reused for every chunk, so 
+    memory use depends on the chunk size rather than the number of samples.
 
-        with open(data_path, "rb") as f:
-            file_content = f.read()
-            array = struct.unpack(f'{len(file_content) // struct.calcsize("f")}f', 
-                                  file_content)
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        compiler: A string indicating the compiler to use, as in run_program.
+        n_registers: Number of registers as an integer.
+        chunk_size: Number of samples per chunk as an integer.
     
-        # Uncomment for timing measurements
-        # duration = time.time() - start_time
-        # print(f'Reading data: {duration:.6f}s')
+    # Returns
+        A generator of float32 NumPy arrays of shape (len(programs), 
+        n_chunk_samples). Each array is only valid until the next one is 
+        requested.
+    """
+    n_samples, n_features = x.shape
+    chunk_size = max(min(chunk_size, n_samples), 1)
+
+    x_chunk = np.empty((chunk_size, n_features), dtype=np.float32)
+    pred = np.empty(len(programs) * chunk_size, dtype=np.float32)
+
+    def chunks():
+        for start in range(0, n_samples, chunk_size):
+            end = min(start + chunk_size, n_samples)
+            x_chunk[:end - start] = x[start:end]
+            yield end - start
+
+    if compiler == 'numpy':
+        for n in chunks():
+            yield vectorised.run_program(x_chunk[:n], programs, n_registers)
+
+    elif compiler == 'interpreter':
+        library = interpreter.load_library()
+        code, offsets, consts = ir.assemble(programs, n_registers, n_features)
+        code = np.ascontiguousarray(code)
+
+        for n in chunks():
+            library.evaluate(x_chunk, n, n_features, n_registers, code, offsets, 
+                             len(programs), consts, len(consts), pred)
+            yield pred[:len(programs) * n].reshape(len(programs), n)
+
+    elif compiler == 'gcc':
+        flags = compile_flags(compiler, resolve_profile(compiler, chunk_size))
+        expressions = [ir.as_expression(program) for program in programs]
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            library = load_library_gcc(generate_library_gcc(n_features, expressions, n_registers), 
+                                       tmpdirname, flags)
+
+        try:
+            for n in chunks():
+                library.evaluate_population(x_chunk, n, pred)
+                yield pred[:len(programs) * n].reshape(len(programs), n)
+        finally:
+            _ctypes.dlclose(library._handle)
+
+    else:
+        # The CUDA programs have the number of samples built in, so they are 
+        # compiled for a full chunk and the last chunk is padded.
+        flags = compile_flags(compiler, resolve_profile(compiler, chunk_size))
+        expressions = [ir.as_expression(program) for program in programs]
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            program_path = os.path.join(tmpdirname, 'program.cu')
+            executable_path = os.path.join(tmpdirname, 'executable')
+            input_path = os.path.join(tmpdirname, 'input.bin')
+            data_path = os.path.join(tmpdirname, 'data.bin')
+
+            if compiler == 'nvcc' and not nvcc_batched:
+                code = generate_code_nvcc(x_chunk, expressions, n_registers)
+            else:
+                code = generate_code_nvcc_batched(x_chunk, expressions, n_registers, 
+                                                  nvcc_block_size, nvcc_streams)
+
+            with open(program_path, 'w') as f:
+                f.write(code)
+
+            if compiler == 'nvcc':
+                compile_command = ['nvcc', program_path, '-o', executable_path, *flags]
+            elif compiler == 'nvcc-host':
+                compile_command = ['gcc', '-x', 'c', program_path, '-x', 'none', '-o', executable_path, *flags, '-lm']
+
+            subprocess.run(compile_command, check=True)
 
-    return np.array(array).reshape((len(expressions), x.shape[0]))
\ No newline at end of file
+            for n in chunks():
+                x_chunk.tofile(input_path)
+                subprocess.run([executable_path, input_path, data_path], check=True)
+                
+                chunk_pred = np.fromfile(data_path, dtype=np.float32)
+                yield chunk_pred.reshape(len(programs), chunk_size)[:, :n]
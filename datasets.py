@@ -5,11 +5,98 @@ import math
 import numpy as np
 import kagglehub
 import os
+import glob
+import json
+import shutil
+import hashlib
+import uuid
+
+import imagedata
 
 from sklearn.utils import shuffle
 from sklearn.model_selection import train_test_split
 from imblearn.under_sampling import RandomUnderSampler
 
+# Increment when the preprocessing changes so that stale cached features are 
+# not reused. An empty GE_DATASET_CACHE disables the cache.
+CACHE_VERSION = 2
+cache_directory = os.environ.get('GE_DATASET_CACHE', 
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'ge-datasets'))
+
+
+def load_cached(name, params, build):
+    """Loads arrays from the on-disk feature cache, building and storing them 
+    on the first call with a given set of parameters. Cached arrays are 
+    memory-mapped read-only.
+
+    # Arguments
+        name: A string naming the cached item.
+        params: A JSON-serialisable object with the parameters of the item.
+        build: A function without arguments returning a tuple of NumPy 
+            arrays.
+    
+    # Returns
+        A tuple of NumPy arrays.
+    """
+    if not cache_directory:
+        return build()
+    
+    key = hashlib.sha1(json.dumps([CACHE_VERSION, name, params]).encode()).hexdigest()
+    path = os.path.join(cache_directory, f'{name}-{key}')
+
+    if not os.path.isdir(path):
+        arrays = build()
+
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        os.makedirs(tmp_path)
+
+        for i, array in enumerate(arrays):
+            np.save(os.path.join(tmp_path, f'{i}.npy'), array)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process stored the same item first.
+            shutil.rmtree(tmp_path, True)
+
+    n_arrays = len([f for f in os.listdir(path) if f.endswith('.npy')])
+    
+    return tuple(np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r') 
+                 for i in range(n_arrays))
+
+
+DRIVE_HANDLE = 'andrewmvd/drive-digital-retinal-images-for-vessel-extraction'
+
+
+def drive_download():
+    """Downloads the DRIVE dataset, if required.
+
+    # Returns
+        String containing the path to the DRIVE training directory.
+    """
+    return os.path.join(kagglehub.dataset_download(DRIVE_HANDLE), 'DRIVE', 'training')
+
+
+def drive_local_path():
+    """Finds a copy of the DRIVE dataset that kagglehub has already 
+    downloaded, without downloading it.
+
+    # Returns
+        String containing the path to the DRIVE training directory of the 
+        latest downloaded version, or None.
+    """
+    root = os.environ.get('KAGGLEHUB_CACHE', 
+                          os.path.join(os.path.expanduser('~'), '.cache', 'kagglehub'))
+    paths = glob.glob(os.path.join(root, 'datasets', *DRIVE_HANDLE.split('/'), 
+                                   'versions', '*', 'DRIVE', 'training'))
+    paths = [path for path in paths if path.split(os.sep)[-3].isdigit()]
+
+    if not paths:
+        return None
+
+    return max(paths, key=lambda path: int(path.split(os.sep)[-3]))
+
+
 def spiral(n_samples=None, test_size=0.2, random_seed=42):
     """Generates train and test data for the spiral problem.
 
@@ -56,19 +143,26 @@ def spiral_generate():
 
     data = np.array(ds)
 
-    X = data[:,:-1]
-    y = data[:,-1]
+    X = data[:,:-1].astype(np.float32)
+    y = data[:,-1].astype(np.uint8)
 
     return X, y
 
 
-def drive(n_samples=None, test_size=0.2, random_seed=42):
-    """Generates train and test data for the DRIVE dataset.
+def drive(n_samples=None, test_size=0.2, random_seed=42, window_size=7, 
+          channel='G', image_native=False):
+    """Generates train and test data for the DRIVE dataset. Results are 
+    served from the feature cache after the first call.
 
     # Arguments
         n_samples: Number of samples as an integer or None.
         test_size: A float indicating the proportion for the test set.
         random_seed: Random seed value as an integer.
+        window_size: Dimension for sliding window kernel as an integer.
+        channel: A single character to indicate RGB channel or None.
+        image_native: A boolean indicating whether to return inputs as 
+            imagedata.WindowedImages objects instead of feature matrices. 
+            The same samples are selected in the same order.
     
     # Returns
         A tuple of NumPy arrays with train and test data.
@@ -78,50 +172,134 @@ def drive(n_samples=None, test_size=0.2, random_seed=42):
                                                        test_size=test_size, 
                                                        random_state=random_seed)
     
-    X_train, y_train = drive_preprocessing(image_ids_train)
-    X_test, y_test = drive_preprocessing(image_ids_test)
+    if image_native:
+        preprocessing = drive_pixels
+        name = 'drive-pixels-train'
+    else:
+        preprocessing = drive_preprocessing
+        name = 'drive-train'
+
+    def build():
+        X_train, y_train = preprocessing(image_ids_train, window_size, channel)
+
+        if image_native:
+            X_train = X_train.offsets.reshape(-1, 1)
+        
+        X_train, y_train = RandomUnderSampler(random_state=random_seed).fit_resample(X_train, y_train)
+        X_train, y_train = shuffle(X_train, y_train, random_state=random_seed, n_samples=n_samples)
 
-    X_train, y_train = RandomUnderSampler(random_state=random_seed).fit_resample(X_train, y_train)
-    X_train, y_train = shuffle(X_train, y_train, random_state=random_seed, n_samples=n_samples)
+        return X_train, y_train
+
+    params = {'image_ids': list(image_ids_train), 'window_size': window_size, 
+              'channel': channel, 'random_seed': random_seed, 
+              'n_samples': n_samples}
+    
+    X_train, y_train = load_cached(name, params, build)
+    X_test, y_test = preprocessing(image_ids_test, window_size, channel)
+
+    if image_native:
+        images = preprocessing(image_ids_train, window_size, channel)[0].images
+        X_train = imagedata.WindowedImages(images, X_train.reshape(-1), window_size)
 
     return X_train, X_test, y_train, y_test
 
 
-def drive_preprocessing(image_ids, window_size=7):
+def drive_pixels(image_ids, window_size=7, channel='G'):
+    """Imports the DRIVE dataset as image-native pixel-wise samples, which 
+    are represented by the images and the offsets of their sliding windows. 
+    Samples are in the same order as in drive_preprocessing. Results are 
+    served from the feature cache after the first call.
+
+    # Arguments
+        image_ids: List of image IDs to include in dataset.
+        window_size: Dimension for sliding window kernel as an integer.
+        channel: A single character to indicate RGB channel.
+    
+    # Returns
+        A tuple containing an imagedata.WindowedImages object and a uint8 
+        NumPy array of classes.
+    """
+    image_ids = [int(image_id) for image_id in image_ids]
+
+    def build():
+        drive_path = drive_download()
+        trim = (window_size - 1) // 2
+
+        images = []
+        offsets = []
+        labels = []
+        for k, image_id in enumerate(image_ids):
+            image, manual, mask = drive_load_image(drive_path, image_id, channel)
+
+            mask = mask[trim:-trim, trim:-trim].astype(bool)
+            rows, cols = np.nonzero(mask)
+
+            images.append(image)
+            offsets.append(k * image.size + rows * image.shape[1] + cols)
+            labels.append(manual[trim:-trim, trim:-trim][mask] // 255)
+
+        images = np.stack(images)
+        offsets = np.concatenate(offsets).astype(np.uint32)
+        y = np.concatenate(labels).astype(np.uint8)
+
+        return images, offsets, y
+
+    params = {'image_ids': image_ids, 'window_size': window_size, 
+              'channel': channel}
+
+    images, offsets, y = load_cached('drive-pixels', params, build)
+
+    return imagedata.WindowedImages(images, offsets, window_size), y
+
+
+def drive_preprocessing(image_ids, window_size=7, channel='G'):
     """Imports and applies preprocessing to the DRIVE dataset to produce 
-    pixel-wise samples.
+    pixel-wise samples. Results are served from the feature cache after the 
+    first call.
 
     # Arguments
         image_ids: List of image IDs to include in dataset.
         window_size: Dimension for sliding window kernel as an integer.
+        channel: A single character to indicate RGB channel or None.
     
     # Returns
-        A tuple of NumPy arrays containing input and output values.
+        A tuple containing a float32 NumPy array of input values and a uint8 
+        NumPy array of classes.
     """
-    handle = 'andrewmvd/drive-digital-retinal-images-for-vessel-extraction'
-    drive_path = os.path.join(kagglehub.dataset_download(handle), 'DRIVE', 'training')
+    image_ids = [int(image_id) for image_id in image_ids]
 
-    ds = []
-    for image_id in image_ids:
-        image, manual, mask = drive_load_image(drive_path, image_id)
+    def build():
+        drive_path = drive_download()
 
-        image = np.lib.stride_tricks.sliding_window_view(image, 
-                                                         (window_size, window_size), 
-                                                         axis=(0, 1)) / 255
-        
+        # Windows are gathered as uint8 and scaled through a lookup table, 
+        # which gives the same float32 values as dividing in float64 without 
+        # allocating float64 copies of the feature matrix.
+        scale = (np.arange(256) / 255).astype(np.float32)
         trim = (window_size - 1) // 2
 
-        manual = manual[trim:-trim, trim:-trim] / 255
-        mask = mask[trim:-trim, trim:-trim].astype(bool)
+        windows = []
+        labels = []
+        for image_id in image_ids:
+            image, manual, mask = drive_load_image(drive_path, image_id, channel)
 
-        ds.append(np.dstack((image.reshape(*image.shape[:2], -1), manual))[mask])
+            image = np.lib.stride_tricks.sliding_window_view(image, 
+                                                             (window_size, window_size), 
+                                                             axis=(0, 1))
+            
+            mask = mask[trim:-trim, trim:-trim].astype(bool)
 
-    data = np.vstack(ds)
-    
-    X = data[:,:-1]
-    y = data[:,-1]
+            windows.append(image[mask].reshape(np.count_nonzero(mask), -1))
+            labels.append(manual[trim:-trim, trim:-trim][mask] // 255)
 
-    return X, y
+        X = scale[np.concatenate(windows)]
+        y = np.concatenate(labels).astype(np.uint8)
+
+        return X, y
+
+    params = {'image_ids': image_ids, 'window_size': window_size, 
+              'channel': channel}
+
+    return load_cached('drive', params, build)
 
 
 def drive_load_image(drive_path, image_id, channel='G', greyscale=False):
@@ -167,9 +345,6 @@ def drive_get_sample_image(test_size=0.2, random_seed=42):
         A tuple containing the image, manual annotation, mask, and sample data 
         as NumPy arrays.
     """
-    handle = 'andrewmvd/drive-digital-retinal-images-for-vessel-extraction'
-    drive_path = os.path.join(kagglehub.dataset_download(handle), 'DRIVE', 'training')
-
     image_ids = range(21, 40 + 1)
     image_ids_test = train_test_split(image_ids,
                                       test_size=test_size, 
@@ -177,29 +352,77 @@ def drive_get_sample_image(test_size=0.2, random_seed=42):
     
     image_id = image_ids_test[0]
     
-    image, manual, mask = drive_load_image(drive_path, image_id)
+    image, manual, mask = drive_load_image(drive_download(), image_id)
 
     X_sample, _ = drive_preprocessing([image_id])
 
     return image, manual, mask, X_sample
 
 
-def drive_annotate_sample_image(mask, y_sample):
-    """Generates an annotated image using predictions.
+def drive_get_test_images(test_size=0.2, random_seed=42):
+    """Retrieves all images from the test set, in the order of the samples 
+    returned by drive.
+
+    # Arguments
+        test_size: A float indicating the proportion for the test set.
+        random_seed: Random seed value as an integer.
+    
+    # Returns
+        A tuple containing the list of image IDs, and the images, manual 
+        annotations and masks stacked as NumPy arrays.
+    """
+    image_ids = range(21, 40 + 1)
+    image_ids_test = train_test_split(image_ids,
+                                      test_size=test_size, 
+                                      random_state=random_seed)[1]
+    
+    drive_path = drive_download()
+    images, manuals, masks = zip(*[drive_load_image(drive_path, image_id) 
+                                   for image_id in image_ids_test])
+
+    return list(image_ids_test), np.stack(images), np.stack(manuals), np.stack(masks)
+
+
+def drive_reconstruct(mask, values, window_size=7, fill=0):
+    """Scatters pixel-wise values back into image space. Samples cover the 
+    masked pixels outside the border trimmed by the sliding window, in the 
+    order used by drive_preprocessing.
 
     # Arguments
-        mask: The mask image as a NumPy array.
-        y_sample: Predictions for the image sample from the test set.
+        mask: A mask image as a NumPy array of shape (height, width), or a 
+            stack of masks of shape (n_images, height, width).
+        values: A NumPy array with one value per sample, concatenated over 
+            the images.
+        window_size: Dimension for sliding window kernel as an integer.
+        fill: The value for pixels without a sample.
     
     # Returns
-        Annotated image as a NumPy array.
+        A NumPy array with the shape of mask and the dtype of values.
     """
-    annotation = mask.copy()
-    y_sample_iter = iter(y_sample)
+    values = np.asarray(values)
+    trim = (window_size - 1) // 2
+
+    sampled = np.zeros(mask.shape, dtype=bool)
+    sampled[..., trim:-trim, trim:-trim] = mask[..., trim:-trim, trim:-trim]
+
+    image = np.full(mask.shape, fill, dtype=values.dtype)
+    image[sampled] = values
+
+    return image
+
+
+def drive_annotate_sample_image(mask, y_sample, window_size=7):
+    """Generates annotated images using predictions.
 
-    for i in range(annotation.shape[0]):
-        for j in range(annotation.shape[1]):
-            if annotation[i, j]:
-                annotation[i, j] = 255 * next(y_sample_iter)
+    # Arguments
+        mask: The mask image as a NumPy array, or a stack of masks.
+        y_sample: Predicted classes, or probabilities between 0 and 1, for 
+            the image samples from the test set.
+        window_size: Dimension for sliding window kernel as an integer.
     
-    return annotation
\ No newline at end of file
+    # Returns
+        Annotated image, or stack of images, as a uint8 NumPy array.
+    """
+    intensity = 255 * np.clip(np.asarray(y_sample, dtype=np.float32), 0, 1)
+
+    return np.rint(drive_reconstruct(mask, intensity, window_size)).astype(np.uint8)
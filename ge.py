@@ -2,8 +2,15 @@
 
 import datasets
 import codegen
-
-from instructions import add, sub, mul, pdiv, aq, swap, sin, cos, tanh, if_gt
+import cache
+import checkpoint
+import incremental
+import ir
+import objcache
+import profiling
+import session
+import simplify
+import worker
 
 import grape.grape as grape
 import grape.algorithms as algorithms
@@ -13,6 +20,11 @@ from deap import creator, base, tools
 import os
 import argparse
 import time
+import contextlib
+import copy
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 import numpy as np
@@ -24,15 +36,18 @@ import json
 import warnings
 warnings.filterwarnings("ignore")
 
-# Uncomment for timing measurements
-# import sys
+phenotype_cache = cache.PhenotypeCache()
+
+_pool_data = None
 
-def set_dataset(problem, n_samples=None):
+def set_dataset(problem, n_samples=None, image_native=False):
     """Sets dataset for the problem.
 
     # Arguments
         problem: A string indicating the problem.
         n_samples: Number of samples as an integer or None.
+        image_native: A boolean indicating whether to represent DRIVE samples 
+            by the images and their window offsets.
     
     # Returns
         A tuple of NumPy arrays with train and test data.
@@ -41,7 +56,8 @@ def set_dataset(problem, n_samples=None):
         X_train, X_test, y_train, y_test = datasets.spiral(n_samples=n_samples)
         
     elif problem == 'drive':
-        X_train, X_test, y_train, y_test = datasets.drive(n_samples=n_samples)
+        X_train, X_test, y_train, y_test = datasets.drive(n_samples=n_samples, 
+                                                          image_native=image_native)
 
     return X_train, y_train, X_test, y_test
 
@@ -60,23 +76,43 @@ def set_grammar(problem, n_registers):
     return grape.Grammar(os.path.join('grammars', f'{stem}.bnf'))
 
 
-def mae(y, yhat):
-    """Calculates the mean absolute error between inputs.
+def mae(y, yhat, mask=None):
+    """Calculates the mean absolute error between inputs. Rows of a 2D yhat 
+    are scored independently.
 
     # Arguments
         y: The expected input from the dataset as a NumPy array.
         yhat: The given input from the phenotype as a NumPy array.
+        mask: A boolean NumPy array marking valid predictions or None. 
+            Invalid predictions count as errors.
     
     # Returns
-        The mean absolute error as a float.
+        The mean absolute error as a float or a NumPy array of floats.
     """
     compare = np.equal(y, yhat)
 
-    return 1 - np.mean(compare)
+    if mask is not None:
+        compare &= mask
+
+    return 1 - np.mean(compare, axis=-1)
+
+
+def classify(pred):
+    """Thresholds predictions into classes. NaN predictions are assigned 
+    class 1.
+
+    # Arguments
+        pred: A NumPy array of floating-point predictions.
+    
+    # Returns
+        A NumPy array of classes.
+    """
+    return (~np.less(pred, 0.5)).astype(np.uint8)
 
 
 def evaluate_expression(phenotype):
-    """Evaluates the code expression for an individual.
+    """Generates the code expression for an individual by parsing its 
+    phenotype.
 
     # Arguments
         phenotype: The phenotype of an individual as a string.
@@ -84,15 +120,16 @@ def evaluate_expression(phenotype):
     # Returns
         The code expression as a string.
     """
-    expression = eval(phenotype)
+    return ir.emit_c(ir.parse(phenotype))
 
-    assert np.isrealobj(expression)
 
-    return expression
-
-
-def fitness_eval(population, points, train=True):
-    """Evaluates and assigns the individual fitnesses for a population.
+def fitness_eval(population, points, train=True, elite_size=0, hof=None):
+    """Evaluates and assigns the individual fitnesses for a population. 
+    Programs are simplified before evaluation, duplicate programs are only run 
+    once, and when training, programs seen in earlier generations are served 
+    from the phenotype cache. With incremental evaluation, programs resume 
+    from the register states of the elites and hall of fame members of 
+    earlier generations.
 
     # Arguments
         population: A list of grape.Individual objects.
@@ -100,30 +137,75 @@ def fitness_eval(population, points, train=True):
             registers.
         train: A boolean indicating whether to train in this fitness 
             evaluation.
+        elite_size: Elite size of the run as an integer, whose best 
+            individuals are snapshotted with incremental evaluation.
+        hof: A tools.HallOfFame object whose members are snapshotted with 
+            incremental evaluation, or None.
     
     # Returns
         Fitnesses of the population if training and otherwise None.
     """
     (x, y), compiler, n_registers = points
 
-    expressions = []
+    if train:
+        phenotype_cache.scope(x, y)
+        phenotype_cache.reset_counters()
+        profiling.reset()
+
+    incremental_eval = train and incremental.enabled and compiler in incremental.COMPILERS
+
+    # Profiles such as fast-run can change predictions, so cached entries are 
+    # only served to evaluations that are compiled with the same profile.
+    profile = codegen.resolve_profile(compiler, len(y)) if compiler in codegen.COMPILED else None
+
+    keys = {}
+    results = {}
+    programs = {}
+    parsed_programs = {}
     for individual in population:
         if (train and individual.fitness.valid) or individual.invalid:
             continue
         
-        expressions.append(evaluate_expression(individual.phenotype))
+        parsed = ir.parse(individual.phenotype)
+        program = simplify.simplify(parsed) if simplify.enabled else parsed
+
+        key = phenotype_cache.key(program, compiler, n_registers, profile)
+        keys[id(individual)] = key
+
+        if key in results or key in programs:
+            if train:
+                phenotype_cache.hits += 1
+            continue
+
+        entry = phenotype_cache.get(key) if train else None
 
-    pred = codegen.run_program(x, expressions, compiler, n_registers)
+        if entry is None:
+            programs[key] = program
+            parsed_programs[key] = parsed
+        else:
+            results[key] = entry[1]
+
+    # The programs are passed as arrays, and C code is only emitted for the 
+    # compiled backends.
+    if programs and incremental_eval:
+        with profiling.phase('execute'):
+            pred = incremental.run_program(x, list(parsed_programs.values()), compiler, n_registers)
+    elif programs:
+        pred = codegen.run_program(x, list(programs.values()), compiler, n_registers)
+    else:
+        pred = np.empty((0, len(y)), dtype=np.float32)
+
+    with np.errstate(invalid='ignore'):
+        batch_fitness = mae(y, classify(pred), np.isfinite(pred))
 
-    # Uncomment for timing measurements
-    # print("gcc")
-    # codegen.run_program(x, expressions, "gcc", n_registers)
-    # print("nvcc")
-    # codegen.run_program(x, expressions, "nvcc", n_registers)
-    # sys.exit(0)
+    for i, key in enumerate(programs):
+        fitness = batch_fitness[i]
+        results[key] = fitness
+
+        if train:
+            phenotype_cache.put(key, pred[i], fitness)
 
     fitnesses = []
-    i = 0
     for individual in population:
         if train and individual.fitness.valid:
             continue
@@ -131,23 +213,184 @@ def fitness_eval(population, points, train=True):
         if individual.invalid:
             fitness = np.NaN
         else:
-            try:
-                y_class = [0 if pred[i][j] < 0.5 else 1 for j in range(len(y))]
-            except (IndexError, TypeError):
-                fitness = np.NaN
-            
-            fitness = mae(y, y_class)
-            i += 1
+            fitness = results[keys[id(individual)]]
     
         if train:
             individual.fitness.values = fitness,
         else:
             fitnesses.append(fitness)
 
+    # The elites and hall of fame members are likely parents of the next 
+    # generation, whose offspring share instruction prefixes with them. Hall 
+    # of fame members are included after they have left the population.
+    if incremental_eval:
+        elites = sorted([individual for individual in population 
+                         if not individual.invalid and np.isfinite(individual.fitness.values[0])],
+                        key=lambda individual: individual.fitness.values[0])
+        members = elites[:elite_size] + (list(hof.items) if hof is not None else [])
+        phenotypes = list(dict.fromkeys(individual.phenotype for individual in members))
+
+        with profiling.phase('snapshot'):
+            incremental.snapshot(x, [ir.parse(phenotype) for phenotype in phenotypes], 
+                                 compiler, n_registers)
+
     if not train:
         return fitnesses
 
 
+class FitnessSampler:
+    """Splits the training data into batches and selects the batch used for 
+    fitness evaluation in each generation. 'rotating' mode cycles through 
+    stratified random batches, and 'interleaved' mode through every n-th 
+    sample.
+    """
+    def __init__(self, X, y, mode='rotating', fraction=0.1, random_seed=0):
+        """Initialises the FitnessSampler object.
+
+        # Arguments
+            X: A NumPy array containing training features.
+            y: A NumPy array containing expected training classes.
+            mode: A string indicating the sampling mode.
+            fraction: The proportion of the training data in each batch as a 
+                float.
+            random_seed: Random seed value as an integer.
+
+        # Returns
+            None.
+        """
+        n_batches = max(int(round(1 / fraction)), 1)
+        y = np.asarray(y)
+
+        if mode == 'rotating':
+            rng = np.random.default_rng(random_seed)
+            parts = [[] for _ in range(n_batches)]
+
+            for label in np.unique(y):
+                indices = rng.permutation(np.flatnonzero(y == label))
+                for part, split in zip(parts, np.array_split(indices, n_batches)):
+                    part.append(split)
+
+            batches = [np.sort(np.concatenate(part)) for part in parts]
+        elif mode == 'interleaved':
+            batches = [np.arange(k, len(y), n_batches) for k in range(n_batches)]
+        else:
+            raise ValueError(f'Unknown fitness sampling mode: {mode}')
+
+        self.batches = [(X[indices], y[indices]) for indices in batches]
+        self.generation = 0
+
+
+    def next(self):
+        """Returns the batch for the current generation and advances to the 
+        next generation.
+
+        # Returns
+            A tuple of NumPy arrays with features and classes.
+        """
+        batch = self.batches[self.generation % len(self.batches)]
+        self.generation += 1
+
+        return batch
+
+
+def same_phenotype(a, b):
+    """Checks whether two individuals have the same phenotype.
+
+    # Arguments
+        a: A grape.Individual object.
+        b: A grape.Individual object.
+
+    # Returns
+        A boolean.
+    """
+    return a.phenotype == b.phenotype
+
+
+class FullDataHallOfFame(tools.HallOfFame):
+    """Hall of fame for runs with fitness sampling. The best individuals of 
+    each generation on its batch are scored on the full training data before 
+    they are offered to the hall of fame, so that its members are only ever 
+    compared by full-data fitnesses. The candidates are copies, so members 
+    are told apart by phenotype.
+    """
+    def __init__(self, maxsize, points, items=()):
+        """Initialises the FullDataHallOfFame object.
+
+        # Arguments
+            maxsize: Hall-of-fame size as an integer.
+            points: A tuple containing the full training data points, 
+                compiler, and number of registers.
+            items: A list of grape.Individual objects with full-data 
+                fitnesses to start from.
+
+        # Returns
+            None.
+        """
+        super().__init__(maxsize, similar=same_phenotype)
+        self.points = points
+        self.scores = {}
+
+        for individual in items:
+            self.insert(individual)
+
+
+    def update(self, population):
+        """Scores the best maxsize individuals of the population on the full 
+        training data and updates the hall of fame with copies carrying those 
+        fitnesses. The population keeps its batch fitnesses for selection.
+
+        # Arguments
+            population: A list of grape.Individual objects.
+
+        # Returns
+            None.
+        """
+        candidates = sorted([individual for individual in population 
+                             if not individual.invalid and individual.fitness.valid 
+                             and np.isfinite(individual.fitness.values[0])],
+                            key=lambda individual: individual.fitness.values[0])
+        candidates = [copy.deepcopy(individual) for individual in candidates[:self.maxsize]]
+
+        # Elites return to the population every generation, so their full-data 
+        # fitnesses are remembered by phenotype.
+        unscored = [individual for individual in candidates 
+                    if individual.phenotype not in self.scores]
+        if unscored:
+            for individual, fitness in zip(unscored, fitness_eval(unscored, self.points, train=False)):
+                self.scores[individual.phenotype] = fitness
+
+        for individual in candidates:
+            individual.fitness.values = self.scores[individual.phenotype],
+
+        super().update(candidates)
+
+
+def sampled_fitness_eval(population, points, sampler, elite_size=0, hof=None):
+    """Evaluates the whole population on the batch selected for the current 
+    generation.
+
+    # Arguments
+        population: A list of grape.Individual objects.
+        points: A tuple containing data points, compiler, and number of 
+            registers.
+        sampler: A FitnessSampler object.
+        elite_size: Elite size of the run as an integer.
+        hof: A tools.HallOfFame object or None.
+
+    # Returns
+        None.
+    """
+    _, compiler, n_registers = points
+
+    # Fitnesses from earlier batches are not comparable.
+    for individual in population:
+        if individual.fitness.valid:
+            del individual.fitness.values
+
+    fitness_eval(population, (sampler.next(), compiler, n_registers), 
+                 elite_size=elite_size, hof=hof)
+
+
 def create_toolbox(tournsize):
     """Creates a toolbox using primitive set and declared parameters.
 
@@ -159,8 +402,12 @@ def create_toolbox(tournsize):
     """
     toolbox = base.Toolbox()
 
-    creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
-    creator.create("Individual", grape.Individual, fitness=creator.FitnessMin)
+    # Only create the classes once per process so that individuals from 
+    # earlier runs remain instances of creator.Individual and can be pickled.
+    if not hasattr(creator, "FitnessMin"):
+        creator.create("FitnessMin", base.Fitness, weights=(-1.0,))
+    if not hasattr(creator, "Individual"):
+        creator.create("Individual", grape.Individual, fitness=creator.FitnessMin)
     toolbox.register("populationCreator", grape.sensible_initialisation, creator.Individual)
     toolbox.register("evaluate", fitness_eval)
     toolbox.register("select", tools.selTournament, tournsize=tournsize)
@@ -183,6 +430,12 @@ def create_stats():
     stats.register("std", np.nanstd)
     stats.register("min", np.nanmin)
     stats.register("max", np.nanmax)
+    stats.register("cache_hit_rate", lambda _: phenotype_cache.hit_rate())
+    stats.register("cache_miss_rate", lambda _: phenotype_cache.miss_rate())
+
+    if profiling.enabled:
+        for name, item in zip(profiling.PHASES, profiling.report_items()):
+            stats.register(item, lambda _, name=name: profiling.timings[name])
 
     return stats
 
@@ -196,7 +449,7 @@ def display_best(hof):
     # Returns
         None.
     """
-    print("\nBest individual:\n" + eval(hof.items[0].phenotype) + "\n")
+    print("\nBest individual:\n" + evaluate_expression(hof.items[0].phenotype) + "\n")
     print("Training fitness:", hof.items[0].fitness.values[0])
     print("Depth:", hof.items[0].depth)
     print("Length of the genome:", len(hof.items[0].genome))
@@ -247,7 +500,9 @@ def save_run_info(output_path, run, hof, duration):
 def run_algorithm(X_train, y_train, problem, compiler, n_registers, pop_size, 
                   ngen, cxpb, mutpb, elite_size, hof_size, tournsize, 
                   max_init_depth, min_init_depth, max_tree_depth, run=0, 
-                  output_path=None):
+                  output_path=None, compile_profile='fast-compile', 
+                  fitness_sampling=None, fitness_fraction=0.1, state=None, 
+                  checkpoint_every=0, resume=False):
     """Runs the main flow of the GE algorithm.
 
     # Arguments
@@ -269,10 +524,27 @@ def run_algorithm(X_train, y_train, problem, compiler, n_registers, pop_size,
         run: Current run number.
         output_path: A string containing the path for the output directory or 
             None.
+        compile_profile: A string with the name of the compile profile for 
+            generated code, or 'auto'.
+        fitness_sampling: A string indicating the FitnessSampler mode used to 
+            evaluate each generation on a batch of the training data, or None 
+            to use all of it.
+        fitness_fraction: The proportion of the training data in each batch 
+            as a float. The hall of fame is scored on the full training data.
+        state: A dictionary or None. If it holds the population and hall of 
+            fame of an earlier call, evolution continues from them for ngen 
+            more generations. The dictionary is updated with the population, 
+            hall of fame, logbook and total generations.
+        checkpoint_every: Number of generations between checkpoints as an 
+            integer. Zero disables checkpoints. Requires output_path.
+        resume: A boolean indicating whether to continue from the checkpoint 
+            of the run, if one exists.
 
     # Returns
         Best individual as a grape.Individual object.
     """
+    codegen.set_compile_profile(compile_profile)
+
     bnf_grammar = set_grammar(problem, n_registers)
     if problem == 'drive':
         n_registers += 1
@@ -285,47 +557,122 @@ def run_algorithm(X_train, y_train, problem, compiler, n_registers, pop_size,
                     'best_ind_length', 'avg_length', 'best_ind_nodes', 
                     'avg_nodes', 'best_ind_depth', 'avg_depth', 
                     'avg_used_codons', 'best_ind_used_codons', 
-                    'structural_diversity', 'selection_time', 
-                    'generation_time']
+                    'structural_diversity', 'cache_hit_rate', 
+                    'cache_miss_rate', 'selection_time', 'generation_time']
+    
+    if profiling.enabled:
+        report_items += profiling.report_items()
     
     start_time = time.time()
 
     toolbox = create_toolbox(tournsize=tournsize)
 
-    population = toolbox.populationCreator(pop_size=pop_size,
-                                           bnf_grammar=bnf_grammar,
-                                           min_init_depth=min_init_depth,
-                                           max_init_depth=max_init_depth,
-                                           codon_size=codon_size,
-                                           codon_consumption=codon_consumption,
-                                           genome_representation=genome_representation)
+    checkpoint_path = None
+    if output_path and checkpoint_every:
+        checkpoint_path = os.path.join(output_path, f'{run}.ckpt.npz')
 
-    hof = tools.HallOfFame(hof_size)
+    logbook = None
+    completed = 0
+
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        restored = checkpoint.load(checkpoint_path, creator.Individual, 
+                                   bnf_grammar, max_tree_depth, 
+                                   codon_consumption, hof_size, report_items)
+        
+        population = restored['population']
+        hof = restored['hof']
+        logbook = restored['logbook']
+        completed = restored['ngen']
+        start_time -= restored['duration']
+
+        print(f"Resuming run {run} from generation {completed}\n")
+    elif state and 'population' in state:
+        population = state['population']
+        hof = state['hof']
+    else:
+        population = toolbox.populationCreator(pop_size=pop_size,
+                                               bnf_grammar=bnf_grammar,
+                                               min_init_depth=min_init_depth,
+                                               max_init_depth=max_init_depth,
+                                               codon_size=codon_size,
+                                               codon_consumption=codon_consumption,
+                                               genome_representation=genome_representation)
+
+        hof = tools.HallOfFame(hof_size)
 
     stats = create_stats()
 
-    population, logbook = algorithms.ge_eaSimpleWithElitism(population,
-                                                            toolbox,
-                                                            cxpb=cxpb,
-                                                            mutpb=mutpb,
-                                                            ngen=ngen,
-                                                            elite_size=elite_size,
-                                                            bnf_grammar=bnf_grammar,
-                                                            codon_size=codon_size,
-                                                            max_tree_depth=max_tree_depth,
-                                                            max_genome_length=None,
-                                                            points_train=([X_train, y_train], 
-                                                                          compiler, 
-                                                                          n_registers),
-                                                            codon_consumption=codon_consumption,
-                                                            report_items=report_items,
-                                                            genome_representation=genome_representation,
-                                                            stats=stats,
-                                                            halloffame=hof,
-                                                            verbose=False)
-    
+    points_train = ([X_train, y_train], compiler, n_registers)
+
+    max_sessions = session.MAX_SESSIONS
+
+    sampler = None
+    if fitness_sampling:
+        sampler = FitnessSampler(X_train, y_train, fitness_sampling, 
+                                 fitness_fraction, random_seed=run)
+
+        hof = FullDataHallOfFame(hof_size, points_train, hof.items)
+
+        # Keeps the batches and the full training data staged across cycles 
+        # for the duration of the run.
+        session.MAX_SESSIONS = max(max_sessions, len(sampler.batches) + 1)
+        toolbox.register("evaluate", sampled_fitness_eval, sampler=sampler, 
+                         elite_size=elite_size, hof=hof)
+    else:
+        toolbox.register("evaluate", fitness_eval, elite_size=elite_size, hof=hof)
+
+    try:
+        # Evolve in segments of checkpoint_every generations. Each segment 
+        # starts by re-recording the already evaluated population as 
+        # generation 0, which is dropped when merging the logbooks.
+        while logbook is None or completed < ngen:
+            segment = ngen - completed
+            if checkpoint_path:
+                segment = min(segment, checkpoint_every)
+
+            # Generation 0 of a segment re-evaluates the last batch, which 
+            # reproduces the fitnesses of an uninterrupted run.
+            if sampler:
+                sampler.generation = completed
+
+            population, segment_logbook = algorithms.ge_eaSimpleWithElitism(population,
+                                                                            toolbox,
+                                                                            cxpb=cxpb,
+                                                                            mutpb=mutpb,
+                                                                            ngen=segment,
+                                                                            elite_size=elite_size,
+                                                                            bnf_grammar=bnf_grammar,
+                                                                            codon_size=codon_size,
+                                                                            max_tree_depth=max_tree_depth,
+                                                                            max_genome_length=None,
+                                                                            points_train=points_train,
+                                                                            codon_consumption=codon_consumption,
+                                                                            report_items=report_items,
+                                                                            genome_representation=genome_representation,
+                                                                            stats=stats,
+                                                                            halloffame=hof,
+                                                                            verbose=False)
+        
+            if logbook is None:
+                logbook = segment_logbook
+            else:
+                for record in segment_logbook[1:]:
+                    logbook.record(**{**record, 'gen': record['gen'] + completed})
+
+            completed += segment
+
+            if checkpoint_path:
+                checkpoint.save(checkpoint_path, population, hof, logbook, 
+                                report_items, completed, time.time() - start_time)
+    finally:
+        session.MAX_SESSIONS = max_sessions
+
     duration = time.time() - start_time
 
+    if state is not None:
+        state.update(population=population, hof=hof, logbook=logbook, 
+                     ngen=state.get('ngen', 0) + ngen)
+
     display_best(hof)
 
     if output_path:
@@ -335,10 +682,87 @@ def run_algorithm(X_train, y_train, problem, compiler, n_registers, pop_size,
     return hof.items[0]
 
 
+def run_seeded(run, X_train, y_train, params, output_path=None, 
+               checkpoint_every=0, resume=False):
+    """Seeds the random number generators for a run and runs the GE algorithm.
+
+    # Arguments
+        run: An integer indicating the run number, also used as the seed.
+        X_train: A NumPy array containing training features.
+        y_train: A NumPy array containing expected training classes.
+        params: A dictionary containing GE parameters.
+        output_path: A string containing the path for the output directory or 
+            None.
+        checkpoint_every: Number of generations between checkpoints as an 
+            integer. Zero disables checkpoints.
+        resume: A boolean indicating whether to continue from the checkpoint 
+            of the run, if one exists.
+
+    # Returns
+        Best individual as a grape.Individual object.
+    """
+    np.random.seed(run)
+    random.seed(run)
+
+    return run_algorithm(X_train, y_train, **params, run=run, 
+                         output_path=output_path, 
+                         checkpoint_every=checkpoint_every, resume=resume)
+
+
+def init_pool_worker(X_train, y_train, n_jobs):
+    """Initialises a process pool worker for parallel runs.
+
+    # Arguments
+        X_train: A NumPy array containing training features.
+        y_train: A NumPy array containing expected training classes.
+        n_jobs: Number of parallel runs as an integer.
+
+    # Returns
+        None.
+    """
+    global _pool_data
+
+    _pool_data = X_train, y_train
+    codegen.compile_jobs = max(codegen.compile_jobs // n_jobs, 1)
+
+
+def run_pool_worker(run, params, output_path, checkpoint_every=0, resume=False):
+    """Executes a single run in a process pool worker with its output 
+    redirected to a log file.
+
+    # Arguments
+        run: An integer indicating the run number.
+        params: A dictionary containing GE parameters.
+        output_path: A string containing the path for the output directory or 
+            None.
+        checkpoint_every: Number of generations between checkpoints as an 
+            integer. Zero disables checkpoints.
+        resume: A boolean indicating whether to continue from the checkpoint 
+            of the run, if one exists.
+
+    # Returns
+        A tuple containing the run number, best fitness, duration in seconds 
+        and the traceback of any error or None.
+    """
+    start_time = time.time()
+    log_path = os.path.join(output_path, f'{run}.log') if output_path else os.devnull
+
+    with open(log_path, 'a' if resume else 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            best = run_seeded(run, *_pool_data, params, output_path, 
+                              checkpoint_every, resume)
+        except Exception:
+            return run, None, time.time() - start_time, traceback.format_exc()
+
+    return run, best.fitness.values[0], time.time() - start_time, None
+
+
 def multiple_runs(X_train, y_train, problem, compiler, n_registers, pop_size, 
                   ngen, cxpb, mutpb, elite_size, hof_size, tournsize, 
                   max_init_depth, min_init_depth, max_tree_depth, n_runs=30, 
-                  output_path=None):
+                  output_path=None, compile_profile='fast-compile', 
+                  fitness_sampling=None, fitness_fraction=0.1, n_jobs=1, 
+                  checkpoint_every=0, resume=False):
 
     """Runs the main flow of the GE algorithm multiple times.
 
@@ -361,40 +785,126 @@ def multiple_runs(X_train, y_train, problem, compiler, n_registers, pop_size,
         n_run: Number of runs to execute as an integer.
         output_path: A string containing the path for the output directory or 
             None.
+        compile_profile: A string with the name of the compile profile for 
+            generated code, or 'auto'.
+        fitness_sampling: A string indicating the FitnessSampler mode or 
+            None.
+        fitness_fraction: The proportion of the training data in each batch 
+            as a float.
+        n_jobs: Number of runs to execute in parallel worker processes as an 
+            integer. Each run is seeded with its run number, so results do 
+            not depend on this setting.
+        checkpoint_every: Number of generations between checkpoints as an 
+            integer. Zero disables checkpoints.
+        resume: A boolean indicating whether to skip completed runs and 
+            continue interrupted runs from their checkpoints.
 
     # Returns
         None.
     """
-    
-    for run in range(n_runs):
-        print(f"\nRun: {run}\n")
+    params = {'problem': problem, 'compiler': compiler, 
+              'n_registers': n_registers, 'pop_size': pop_size, 'ngen': ngen, 
+              'cxpb': cxpb, 'mutpb': mutpb, 'elite_size': elite_size, 
+              'hof_size': hof_size, 'tournsize': tournsize, 
+              'max_init_depth': max_init_depth, 
+              'min_init_depth': min_init_depth, 
+              'max_tree_depth': max_tree_depth, 
+              'compile_profile': compile_profile, 
+              'fitness_sampling': fitness_sampling, 
+              'fitness_fraction': fitness_fraction}
+
+    runs = list(range(n_runs))
+    if resume and output_path:
+        runs = [run for run in runs 
+                if not os.path.exists(os.path.join(output_path, f'{run}.json'))]
+        print(f"Skipping {n_runs - len(runs)} completed runs")
+
+    if n_jobs <= 1:
+        for run in runs:
+            print(f"\nRun: {run}\n")
+
+            run_seeded(run, X_train, y_train, params, output_path, 
+                       checkpoint_every, resume)
+        
+        return
 
-        np.random.seed(run)
-        random.seed(run)
+    context = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else 'spawn')
+    failures = []
 
-        run_algorithm(X_train, y_train, problem, compiler, n_registers, 
-                      pop_size, ngen, cxpb, mutpb, elite_size, hof_size, 
-                      tournsize, max_init_depth, min_init_depth, 
-                      max_tree_depth, run, output_path)
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, 
+                             initializer=init_pool_worker, 
+                             initargs=(X_train, y_train, n_jobs)) as executor:
+        futures = [executor.submit(run_pool_worker, run, params, output_path, 
+                                   checkpoint_every, resume) 
+                   for run in runs]
+        
+        for i, future in enumerate(as_completed(futures)):
+            run, fitness, duration, error = future.result()
 
+            if error:
+                failures.append(run)
+                print(f"Run {run} failed after {duration:.1f}s ({i + 1}/{len(runs)}):\n{error}")
+            else:
+                print(f"Run {run} finished in {duration:.1f}s with training fitness {fitness} ({i + 1}/{len(runs)})")
 
-def predict(X, expression, problem, compiler, n_registers):
-    """Runs the main flow of the GE algorithm multiple times.
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(runs)} runs failed: {sorted(failures)}")
+
+
+def predict_chunks(X, program, problem, compiler, n_registers, 
+                   chunk_size=codegen.PREDICT_CHUNK_SIZE):
+    """Predicts classes for consecutive chunks of samples. The program is 
+    compiled once and memory use does not grow with the number of samples.
 
     # Arguments
         X: A NumPy array containing input features.
-        expression: A string containing the code expression for an individual.
+        program: An ir.Program object or a string containing the code 
+            expression for an individual.
+        problem: A string indicating the problem.
         compiler: A string indicating the compiler to use.
         n_registers: Number of registers as an integer.
+        chunk_size: Number of samples per chunk as an integer.
 
     # Returns
-        None.
+        A generator of NumPy arrays of predicted classes.
     """
     if problem == 'drive':
         n_registers += 1
+
+    program = ir.as_program(program)
+    if simplify.enabled:
+        program = simplify.simplify(program)
     
-    pred = codegen.run_program(X, [expression], compiler, n_registers)[0]
-    return [0 if pred[i] < 0.5 else 1 for i in range(len(pred))]
+    for pred in codegen.run_program_chunked(X, [program], compiler, 
+                                            n_registers, chunk_size):
+        yield classify(pred[0])
+
+
+def predict(X, program, problem, compiler, n_registers, 
+            chunk_size=codegen.PREDICT_CHUNK_SIZE):
+    """Predicts classes for input samples with a single individual.
+
+    # Arguments
+        X: A NumPy array containing input features.
+        program: An ir.Program object or a string containing the code 
+            expression for an individual.
+        problem: A string indicating the problem.
+        compiler: A string indicating the compiler to use.
+        n_registers: Number of registers as an integer.
+        chunk_size: Number of samples evaluated at a time as an integer.
+
+    # Returns
+        A NumPy array of predicted classes.
+    """
+    y_class = np.empty(len(X), dtype=np.uint8)
+
+    start = 0
+    for chunk in predict_chunks(X, program, problem, compiler, n_registers, 
+                                chunk_size):
+        y_class[start:start + len(chunk)] = chunk
+        start += len(chunk)
+
+    return y_class
 
 
 def main():
@@ -413,7 +923,10 @@ def main():
         "tournsize": 3,
         "max_init_depth": 12,
         "min_init_depth": 7,
-        "max_tree_depth": 69
+        "max_tree_depth": 69,
+        "compile_profile": "fast-compile",
+        "fitness_sampling": None,
+        "fitness_fraction": 0.1
     }
     
     parser = argparse.ArgumentParser()
@@ -421,7 +934,7 @@ def main():
     parser.add_argument("-i", "--input")
     parser.add_argument("-o", "--output", default=timestamp)
     parser.add_argument("--problem")
-    parser.add_argument("--compiler")
+    parser.add_argument("--compiler", choices=['gcc', 'nvcc', 'interpreter', 'numpy'])
     parser.add_argument("--n_registers", type=int)
     parser.add_argument("--pop_size", type=int)
     parser.add_argument("--ngen", type=int)
@@ -433,14 +946,62 @@ def main():
     parser.add_argument("--max_init_depth", type=int)
     parser.add_argument("--min_init_depth", type=int)
     parser.add_argument("--max_tree_depth", type=int)
+    parser.add_argument("--compile_profile", choices=[*codegen.COMPILE_PROFILES, 'auto'])
+    parser.add_argument("--fitness_sampling", choices=['rotating', 'interleaved'])
+    parser.add_argument("--fitness_fraction", type=float)
     parser.add_argument("--n_samples", type=int)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--cache_size", type=int)
+    parser.add_argument("--object_cache")
+    parser.add_argument("--object_cache_mb", type=int)
+    parser.add_argument("--worker", action='store_true')
+    parser.add_argument("--block_size", type=int)
+    parser.add_argument("--streams", type=int)
+    parser.add_argument("--compile_jobs", type=int)
+    parser.add_argument("--image_native", action='store_true')
+    parser.add_argument("--timing", action='store_true')
+    parser.add_argument("--no_simplify", action='store_true')
+    parser.add_argument("--incremental", action='store_true')
+    parser.add_argument("--snapshot_interval", type=int, default=16)
+    parser.add_argument("--snapshot_memory", type=int, default=256)
+    parser.add_argument("--checkpoint_every", type=int, default=0)
+    parser.add_argument("--resume", action='store_true')
 
     kwargs = dict(parser.parse_args()._get_kwargs())
 
+    if kwargs['resume'] and not kwargs['checkpoint_every']:
+        parser.error("--resume requires --checkpoint_every")
+
+    if kwargs['cache_size'] is not None:
+        phenotype_cache.max_entries = kwargs['cache_size']
+
+    worker.enabled = kwargs['worker']
+    profiling.enabled = kwargs['timing']
+    simplify.enabled = not kwargs['no_simplify']
+    incremental.enabled = kwargs['incremental']
+    incremental.interval = kwargs['snapshot_interval']
+    incremental.state_cache.max_bytes = kwargs['snapshot_memory'] * 2 ** 20
+
+    if kwargs['block_size']:
+        codegen.nvcc_block_size = kwargs['block_size']
+
+    if kwargs['streams']:
+        codegen.nvcc_streams = kwargs['streams']
+
+    if kwargs['compile_jobs']:
+        codegen.compile_jobs = kwargs['compile_jobs']
+
+    if kwargs['object_cache']:
+        objcache.configure(kwargs['object_cache'], 
+                           kwargs['object_cache_mb'] and kwargs['object_cache_mb'] * 2 ** 20)
+
     output_path = os.path.join('results', kwargs['output'])
     os.makedirs(output_path, exist_ok=True)
 
-    if kwargs['input']:
+    if kwargs['resume']:
+        with open(os.path.join(output_path, "params.json")) as jsonfile:
+            params = json.load(jsonfile)['params']
+    elif kwargs['input']:
         with open(kwargs['input']) as jsonfile:
             json_data = json.load(jsonfile)
             params = json_data['params']
@@ -448,13 +1009,20 @@ def main():
     for key in params.keys():
         if kwargs[key]:
             params[key] = kwargs[key]
+
+    if kwargs['incremental'] and params['compiler'] not in incremental.COMPILERS:
+        parser.error("--incremental requires the interpreter or numpy compiler")
     
-    X_train, y_train, _, _ = set_dataset(params['problem'], n_samples=kwargs['n_samples'])
+    X_train, y_train, _, _ = set_dataset(params['problem'], n_samples=kwargs['n_samples'], 
+                                         image_native=kwargs['image_native'])
 
     with open(os.path.join(output_path, "params.json"), "w") as jsonfile:
         json.dump({'params': params}, jsonfile, indent=4)
 
-    multiple_runs(X_train, y_train, **params, output_path=output_path)
+    multiple_runs(X_train, y_train, **params, output_path=output_path, 
+                  n_jobs=kwargs['jobs'], 
+                  checkpoint_every=kwargs['checkpoint_every'], 
+                  resume=kwargs['resume'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+# imagedata.py
+
+import numpy as np
+
+# Pixel intensities scaled to [0, 1] exactly as dividing by 255 in double
+# precision and rounding to float32.
+SCALE = (np.arange(256) / 255).astype(np.float32)
+
+
+class WindowedImages:
+    """Pixel-wise samples stored as the source images and the offset of each
+    sample's sliding window instead of materialised window features. Feature
+    x[j] of a sample is the pixel in row j // window_size and column
+    j % window_size of its window, scaled to [0, 1].
+    """
+    def __init__(self, images, offsets, window_size):
+        """Initialises the WindowedImages object.
+
+        # Arguments
+            images: A uint8 NumPy array of shape (n_images, height, width).
+            offsets: A uint32 NumPy array with the flat index of the top-left
+                pixel of each sample's window in images.
+            window_size: Dimension for sliding window kernel as an integer.
+
+        # Returns
+            None.
+        """
+        self.images = images
+        self.offsets = offsets
+        self.window_size = window_size
+
+
+    @property
+    def shape(self):
+        """The shape of the equivalent feature matrix."""
+        return len(self.offsets), self.window_size ** 2
+
+
+    @property
+    def width(self):
+        """The width of the images in pixels."""
+        return self.images.shape[-1]
+
+
+    def window_offsets(self):
+        """Returns the offset of each window feature relative to the top-left
+        pixel of the window.
+
+        # Returns
+            An int64 NumPy array of length window_size ** 2.
+        """
+        j = np.arange(self.window_size ** 2)
+        return self.width * (j // self.window_size) + j % self.window_size
+
+
+    def windows(self):
+        """Materialises the window features.
+
+        # Returns
+            A float32 NumPy array of shape (n_samples, window_size ** 2).
+        """
+        pixels = self.images.reshape(-1)
+        return SCALE[pixels[self.offsets.astype(np.int64)[:, None] + self.window_offsets()]]
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def __getitem__(self, index):
+        return WindowedImages(self.images, self.offsets[index], self.window_size)
+
+
+    def __array__(self, dtype=None, copy=None):
+        windows = self.windows()
+        return windows if dtype is None else windows.astype(dtype)
@@ -0,0 +1,224 @@
+# incremental.py
+
+import hashlib
+
+import numpy as np
+
+import bytecode
+import cache
+import interpreter
+import ir
+import simplify
+import vectorised
+
+enabled = False
+
+# Backends that can start programs from stored register states.
+COMPILERS = ('interpreter', 'numpy')
+
+# Minimum number of instructions between register state snapshots.
+interval = 16
+
+state_cache = cache.StateCache()
+
+
+def checkpoints(program):
+    """Returns the positions in a program after which register states are
+    snapshotted. Positions are statement boundaries, so that a condition is
+    never separated from the instruction it guards, and are at least
+    interval instructions apart.
+
+    # Arguments
+        program: An ir.Program object.
+
+    # Returns
+        A list of positions as integers.
+    """
+    positions = []
+    last = 0
+    for boundary in (np.flatnonzero(program.opcodes != bytecode.IF_GT) + 1).tolist():
+        if boundary - last >= interval:
+            positions.append(boundary)
+            last = boundary
+
+    return positions
+
+
+def prefix_keys(program, positions, compiler, n_registers):
+    """Builds the cache keys for the prefixes of a program that end at the
+    given positions. Constants are hashed by value, so that programs with
+    different constant pools share keys.
+
+    # Arguments
+        program: An ir.Program object.
+        positions: A list of positions as integers.
+        compiler: A string indicating the compiler to use.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        A list of hexadecimal digests as strings.
+    """
+    columns = [program.opcodes.astype(np.float64)]
+    for operands in (program.dests, program.srcs):
+        kind, index = ir.kinds(operands), ir.indices(operands)
+        value = index.astype(np.float64)
+        value[kind == ir.CONSTANT] = program.consts[index[kind == ir.CONSTANT]]
+        columns += [kind.astype(np.float64), value]
+
+    rows = np.column_stack(columns)
+
+    h = hashlib.sha1(f'{compiler}\0{n_registers}'.encode())
+    keys = []
+    start = 0
+    for position in positions:
+        h.update(rows[start:position].tobytes())
+        keys.append(h.hexdigest())
+        start = position
+
+    return keys
+
+
+def run_segments(x, segments, compiler, n_registers, init, store, states):
+    """Assembles program segments and runs them on a backend that supports
+    register states.
+
+    # Arguments
+        x: A float32 NumPy array of input samples.
+        segments: A list of ir.Program objects.
+        compiler: A string indicating the compiler to use.
+        n_registers: Number of registers as an integer.
+        init: A list with the index of the state each segment starts from,
+            or -1 to initialise the registers from the features.
+        store: A list with the index of the state each segment writes its
+            final registers to, or -1.
+        states: A float32 NumPy array of shape (n_states, n_samples,
+            n_registers), which is updated in place.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    code, offsets, consts = ir.assemble(segments, n_registers, x.shape[1])
+    run_states = interpreter.run_states if compiler == 'interpreter' else vectorised.run_states
+
+    return run_states(x, code, offsets, consts, n_registers,
+                      np.array(init, dtype=np.int64), np.array(store, dtype=np.int64),
+                      states)
+
+
+def run_program(x, programs, compiler, n_registers):
+    """Evaluates programs, starting each from the register state after its
+    longest prefix in the state cache, so that only the differing suffix is
+    executed. Suffixes are simplified when simplification is enabled.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of ir.Program objects.
+        compiler: A string indicating the compiler to use, 'interpreter' or
+            'numpy'.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    state_cache.scope(x)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+
+    suffixes = []
+    init = []
+    resumed = {}
+    for program in programs:
+        position = 0
+        index = -1
+
+        positions = checkpoints(program)
+        keys = prefix_keys(program, positions, compiler, n_registers)
+        for checkpoint_position, key in reversed(list(zip(positions, keys))):
+            if key in state_cache:
+                position = checkpoint_position
+                index = resumed.setdefault(key, len(resumed))
+                break
+
+        suffix = program[position:]
+        if simplify.enabled:
+            suffix = simplify.simplify(suffix)
+
+        suffixes.append(suffix)
+        init.append(index)
+
+    states = np.empty((len(resumed), x.shape[0], n_registers), dtype=np.float32)
+    for key, index in resumed.items():
+        states[index] = state_cache.get(key)
+
+    return run_segments(x, suffixes, compiler, n_registers, init,
+                        [-1] * len(suffixes), states)
+
+
+def snapshot(x, programs, compiler, n_registers):
+    """Stores the register states at the checkpoints of programs in the
+    state cache. Each program resumes from its longest prefix that is
+    already cached, and no more states are computed than the cache can hold.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of ir.Program objects.
+        compiler: A string indicating the compiler to use, 'interpreter' or
+            'numpy'.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        None.
+    """
+    state_cache.scope(x)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+
+    max_states = state_cache.max_bytes // (x.shape[0] * n_registers * 4)
+
+    segments = []
+    init = []
+    store = []
+    cached = {}
+    computed = {}
+    for program in programs:
+        positions = checkpoints(program)
+        keys = prefix_keys(program, positions, compiler, n_registers)
+
+        start = 0
+        previous = -1
+        resume_key = None
+        for position, key in zip(positions, keys):
+            if key in computed:
+                previous = computed[key]
+                resume_key = None
+            elif key in state_cache:
+                # Marks the state as recently used, and only loads it if a 
+                # new segment starts from it.
+                state_cache.get(key)
+                resume_key = key
+            elif len(computed) < max_states:
+                if resume_key is not None:
+                    previous = cached.setdefault(resume_key, len(cached) + len(computed))
+                    resume_key = None
+
+                segments.append(program[start:position])
+                init.append(previous)
+
+                previous = len(cached) + len(computed)
+                computed[key] = previous
+                store.append(previous)
+            else:
+                break
+
+            start = position
+
+    if not segments:
+        return
+
+    states = np.empty((len(cached) + len(computed), x.shape[0], n_registers),
+                      dtype=np.float32)
+    for key, index in cached.items():
+        states[index] = state_cache.get(key)
+
+    run_segments(x, segments, compiler, n_registers, init, store, states)
+
+    for key, index in computed.items():
+        state_cache.put(key, states[index].copy())
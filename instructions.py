@@ -73,6 +73,18 @@ def swap(a, b, temp):
     """
     return f"{temp} = {a}; {a} = {b}; {b} = {temp};"
 
+def mov(dest, src):
+    """Creates line of C code for copying a value into a register.
+
+    # Arguments
+        dest: Destination register as a string.
+        src: Source register as a string.
+    
+    # Returns
+        A string containing C instruction.
+    """
+    return f"{dest} = {src};"
+
 def sin(x):
     """Creates line of C code for sine function.
 
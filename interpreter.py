@@ -0,0 +1,216 @@
+# interpreter.py
+
+import os
+import subprocess
+import tempfile
+import ctypes
+import numpy as np
+
+import ir
+
+SOURCE = r'''
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+enum { ADD, SUB, MUL, PDIV, AQ, MOV, SIN, COS, TANH, IF_GT };
+
+static void run(const int *code, long begin, long end, float *v)
+{
+	for (long k = begin; k < end; k++)
+	{
+		const int *ins = code + 3 * k;
+		float *a = v + ins[1];
+		float b = v[ins[2]];
+
+		switch (ins[0])
+		{
+		case ADD: *a += b; break;
+		case SUB: *a -= b; break;
+		case MUL: *a *= b; break;
+		case PDIV: *a = (b != 0) ? *a / b : *a + 10e6; break;
+		case AQ: *a = *a / sqrt(1 + pow(b, 2)); break;
+		case MOV: *a = b; break;
+		case SIN: *a = sinf(*a); break;
+		case COS: *a = cosf(*a); break;
+		case TANH: *a = tanhf(*a); break;
+		case IF_GT:
+			if (!(*a > b))
+			{
+				k++;
+				while (k < end - 1 && code[3 * k] == IF_GT) k++;
+			}
+			break;
+		}
+	}
+}
+
+void evaluate(const float *x, long n_samples, int n_features, int n_registers,
+              const int *code, const long *offsets, int n_programs,
+              const float *consts, int n_consts, float *pred)
+{
+	int n_slots = n_registers + n_features + n_consts;
+	float *v = (float *)malloc(n_slots * sizeof(float));
+
+	memcpy(v + n_registers + n_features, consts, n_consts * sizeof(float));
+
+	for (long s = 0; s < n_samples; s++)
+	{
+		const float *xs = x + s * n_features;
+		memcpy(v + n_registers, xs, n_features * sizeof(float));
+
+		for (int p = 0; p < n_programs; p++)
+		{
+			for (int i = 0; i < n_registers; i++) v[i] = xs[i % n_features];
+
+			run(code, offsets[p], offsets[p + 1], v);
+
+			pred[p * n_samples + s] = v[0];
+		}
+	}
+
+	free(v);
+}
+
+/* Like evaluate, but program p starts from register state init[p] instead
+   of the features when init[p] >= 0, and writes its final registers to
+   state store[p] when store[p] >= 0. Programs run in order for each sample,
+   so a program may start from a state stored by an earlier program. States
+   are laid out as (n_states, n_samples, n_registers). */
+void evaluate_states(const float *x, long n_samples, int n_features,
+                     int n_registers, const int *code, const long *offsets,
+                     int n_programs, const float *consts, int n_consts,
+                     const long *init, const long *store, float *states,
+                     float *pred)
+{
+	int n_slots = n_registers + n_features + n_consts;
+	float *v = (float *)malloc(n_slots * sizeof(float));
+
+	memcpy(v + n_registers + n_features, consts, n_consts * sizeof(float));
+
+	for (long s = 0; s < n_samples; s++)
+	{
+		const float *xs = x + s * n_features;
+		memcpy(v + n_registers, xs, n_features * sizeof(float));
+
+		for (int p = 0; p < n_programs; p++)
+		{
+			if (init[p] < 0)
+				for (int i = 0; i < n_registers; i++) v[i] = xs[i % n_features];
+			else
+				memcpy(v, states + (init[p] * n_samples + s) * n_registers, n_registers * sizeof(float));
+
+			run(code, offsets[p], offsets[p + 1], v);
+
+			if (store[p] >= 0)
+				memcpy(states + (store[p] * n_samples + s) * n_registers, v, n_registers * sizeof(float));
+
+			pred[p * n_samples + s] = v[0];
+		}
+	}
+
+	free(v);
+}
+'''
+
+_library = None
+
+
+def load_library():
+    """Compiles the register-machine interpreter into a shared library on
+    first use and loads it. Later calls in the same process reuse it.
+
+    # Returns
+        A ctypes.CDLL object for the interpreter.
+    """
+    global _library
+
+    if _library is not None:
+        return _library
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        source_path = os.path.join(tmpdirname, 'interpreter.c')
+        library_path = os.path.join(tmpdirname, 'interpreter.so')
+
+        with open(source_path, 'w') as f:
+            f.write(SOURCE)
+
+        subprocess.run(['gcc', source_path, '-o', library_path, '-shared',
+                        '-fPIC', '-O2', '-ffp-contract=off', '-lm'], check=True)
+
+        library = ctypes.CDLL(library_path)
+
+    floats = np.ctypeslib.ndpointer(dtype=np.float32, flags='C_CONTIGUOUS')
+    ints = np.ctypeslib.ndpointer(dtype=np.int32, flags='C_CONTIGUOUS')
+    longs = np.ctypeslib.ndpointer(dtype=np.int64, flags='C_CONTIGUOUS')
+
+    library.evaluate.restype = None
+    library.evaluate.argtypes = [floats, ctypes.c_long, ctypes.c_int,
+                                 ctypes.c_int, ints, longs, ctypes.c_int,
+                                 floats, ctypes.c_int, floats]
+
+    library.evaluate_states.restype = None
+    library.evaluate_states.argtypes = [floats, ctypes.c_long, ctypes.c_int,
+                                        ctypes.c_int, ints, longs, ctypes.c_int,
+                                        floats, ctypes.c_int, longs, longs,
+                                        floats, floats]
+
+    _library = library
+    return _library
+
+
+def run_program(x, programs, n_registers):
+    """Evaluates programs with the precompiled interpreter.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    library = load_library()
+
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    code, offsets, consts = ir.assemble(programs, n_registers, x.shape[1])
+    pred = np.empty((len(programs), x.shape[0]), dtype=np.float32)
+
+    library.evaluate(x, x.shape[0], x.shape[1], n_registers,
+                     np.ascontiguousarray(code), offsets, len(programs),
+                     consts, len(consts), pred)
+
+    return pred
+
+
+def run_states(x, code, offsets, consts, n_registers, init, store, states):
+    """Evaluates assembled programs with the precompiled interpreter, 
+    starting from and storing register states.
+
+    # Arguments
+        x: A float32 NumPy array of input samples.
+        code: An (n, 3) int32 NumPy array of instructions.
+        offsets: An int64 NumPy array of program offsets.
+        consts: The constant pool as a float32 NumPy array.
+        n_registers: Number of registers as an integer.
+        init: An int64 NumPy array with the index of the state each program 
+            starts from, or -1 to initialise the registers from the features.
+        store: An int64 NumPy array with the index of the state each program 
+            writes its final registers to, or -1.
+        states: A float32 NumPy array of shape (n_states, n_samples, 
+            n_registers), which is updated in place. A program may start 
+            from a state stored by an earlier program.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    library = load_library()
+
+    pred = np.empty((len(offsets) - 1, x.shape[0]), dtype=np.float32)
+
+    library.evaluate_states(x, x.shape[0], x.shape[1], n_registers,
+                            np.ascontiguousarray(code), offsets, len(offsets) - 1,
+                            consts, len(consts), init, store, states, pred)
+
+    return pred
@@ -0,0 +1,350 @@
+# ir.py
+
+import re
+
+import numpy as np
+
+import bytecode
+import instructions
+
+REGISTER, FEATURE, CONSTANT = range(3)
+
+# Phenotype functions that write a destination from a source operand.
+BINARY = {'add': bytecode.ADD, 'sub': bytecode.SUB, 'mul': bytecode.MUL,
+          'pdiv': bytecode.PDIV, 'aq': bytecode.AQ, 'mov': bytecode.MOV}
+
+# Phenotype functions that transform a register in place.
+UNARY = {'sin': bytecode.SIN, 'cos': bytecode.COS, 'tanh': bytecode.TANH}
+
+# A phenotype is a concatenation of instruction calls with string literal
+# arguments, joined by "\n" literals.
+CALL = re.compile(r'\s*(\w+)\(\s*("[^"]*"(?:\s*,\s*"[^"]*")*)\s*\)\s*(\+\s*"\\n"\s*\+)?')
+ARGUMENT = re.compile(r'"([^"]*)"')
+
+EMITTERS = {bytecode.ADD: instructions.add, bytecode.SUB: instructions.sub,
+            bytecode.MUL: instructions.mul, bytecode.PDIV: instructions.pdiv,
+            bytecode.AQ: instructions.aq, bytecode.MOV: instructions.mov,
+            bytecode.SIN: instructions.sin, bytecode.COS: instructions.cos,
+            bytecode.TANH: instructions.tanh, bytecode.IF_GT: instructions.if_gt}
+
+
+def encode(kind, index):
+    """Encodes an operand as an integer.
+
+    # Arguments
+        kind: REGISTER, FEATURE or CONSTANT.
+        index: The register, feature or constant pool index as an integer.
+
+    # Returns
+        The encoded operand as an integer.
+    """
+    return index << 2 | kind
+
+
+def kinds(operands):
+    """Returns the kinds of encoded operands.
+
+    # Arguments
+        operands: An integer or NumPy array of encoded operands.
+
+    # Returns
+        The kinds as an integer or NumPy array.
+    """
+    return operands & 3
+
+
+def indices(operands):
+    """Returns the register, feature or constant pool indices of encoded
+    operands.
+
+    # Arguments
+        operands: An integer or NumPy array of encoded operands.
+
+    # Returns
+        The indices as an integer or NumPy array.
+    """
+    return operands >> 2
+
+
+class Program:
+    """A register program stored as arrays of opcodes and encoded destination
+    and source operands. Conditions are IF_GT instructions that compare
+    their destination and source and guard the next instruction, unary
+    functions use their destination as source, and constants index a pool of
+    values local to the program.
+    """
+    def __init__(self, opcodes, dests, srcs, consts):
+        """Initialises the Program object.
+
+        # Arguments
+            opcodes: A uint8 NumPy array of bytecode opcodes.
+            dests: An int32 NumPy array of encoded destination operands.
+            srcs: An int32 NumPy array of encoded source operands.
+            consts: A float64 NumPy array with the constant pool.
+
+        # Returns
+            None.
+        """
+        self.opcodes = opcodes
+        self.dests = dests
+        self.srcs = srcs
+        self.consts = consts
+
+
+    @classmethod
+    def from_instructions(cls, instructions, consts):
+        """Creates a program from a list of instructions.
+
+        # Arguments
+            instructions: A list of (opcode, dest, src) tuples of integers.
+            consts: A list or NumPy array with the constant pool.
+
+        # Returns
+            A Program object.
+        """
+        code = np.array(instructions, dtype=np.int32).reshape(-1, 3)
+
+        return cls(code[:, 0].astype(np.uint8), code[:, 1].copy(),
+                   code[:, 2].copy(), np.array(consts, dtype=np.float64))
+
+
+    def __len__(self):
+        return len(self.opcodes)
+
+
+    def __getitem__(self, index):
+        return Program(self.opcodes[index], self.dests[index], self.srcs[index],
+                       self.consts)
+
+
+    def __iter__(self):
+        return zip(self.opcodes.tolist(), self.dests.tolist(), self.srcs.tolist())
+
+
+    def __eq__(self, other):
+        return (isinstance(other, Program)
+                and np.array_equal(self.opcodes, other.opcodes)
+                and np.array_equal(self.dests, other.dests)
+                and np.array_equal(self.srcs, other.srcs)
+                and np.array_equal(self.consts, other.consts))
+
+
+class Builder:
+    """Collects instructions and a constant pool while parsing a program."""
+    def __init__(self):
+        """Initialises the Builder object.
+
+        # Returns
+            None.
+        """
+        self.instructions = []
+        self.consts = {}
+
+
+    def operand(self, operand):
+        """Encodes an operand given as a string.
+
+        # Arguments
+            operand: An operand as a string, e.g. 'r[0]', 'x[3]' or '5'.
+
+        # Returns
+            The encoded operand as an integer.
+        """
+        match = bytecode.OPERAND.match(operand)
+        if match:
+            return encode(REGISTER if match[1] == 'r' else FEATURE, int(match[2]))
+
+        value = float(operand)
+        if value not in self.consts:
+            self.consts[value] = len(self.consts)
+        return encode(CONSTANT, self.consts[value])
+
+
+    def add(self, opcode, dest, src):
+        """Appends an instruction.
+
+        # Arguments
+            opcode: The bytecode opcode as an integer.
+            dest: Destination operand as a string.
+            src: Source operand as a string.
+
+        # Returns
+            None.
+        """
+        self.instructions.append((opcode, self.operand(dest), self.operand(src)))
+
+
+    def build(self):
+        """Creates the program from the collected instructions.
+
+        # Returns
+            A Program object.
+        """
+        return Program.from_instructions(self.instructions, list(self.consts))
+
+
+def parse(phenotype):
+    """Parses the phenotype of an individual into a program without
+    evaluating it. Swaps are expanded into three moves so that a preceding
+    if_gt only guards the first of them, as in the generated C code.
+
+    # Arguments
+        phenotype: The phenotype of an individual as a string.
+
+    # Returns
+        A Program object.
+    """
+    builder = Builder()
+
+    position = 0
+    separated = True
+    while separated:
+        match = CALL.match(phenotype, position)
+        if match is None:
+            raise ValueError(f'Unsupported phenotype at position {position}: {phenotype[position:position + 40]!r}')
+
+        name, args = match[1], ARGUMENT.findall(match[2])
+
+        if name in BINARY and len(args) == 2:
+            builder.add(BINARY[name], *args)
+        elif name in UNARY and len(args) == 1:
+            builder.add(UNARY[name], args[0], args[0])
+        elif name == 'if_gt' and len(args) == 2:
+            builder.add(bytecode.IF_GT, *args)
+        elif name == 'swap' and len(args) == 3:
+            a, b, temp = args
+            builder.add(bytecode.MOV, temp, a)
+            builder.add(bytecode.MOV, a, b)
+            builder.add(bytecode.MOV, b, temp)
+        else:
+            raise ValueError(f'Unsupported instruction: {match[0].strip()!r}')
+
+        position = match.end()
+        separated = match[3] is not None
+
+    if position != len(phenotype):
+        raise ValueError(f'Unsupported phenotype at position {position}: {phenotype[position:position + 40]!r}')
+
+    return builder.build()
+
+
+def from_expression(expression):
+    """Parses a code expression produced by the instructions module into a
+    program.
+
+    # Arguments
+        expression: A string containing the code expression for an individual.
+
+    # Returns
+        A Program object.
+    """
+    builder = Builder()
+    for name, a, b in bytecode.parse_expression(expression):
+        builder.add(bytecode.OPCODES[name], a, b)
+
+    return builder.build()
+
+
+def emit_c(program, feature=None):
+    """Emits a program as C statements, which are also valid in CUDA device
+    functions.
+
+    # Arguments
+        program: A Program object.
+        feature: A function that returns the C expression for feature x[j]
+            given j, or None to read x[j].
+
+    # Returns
+        A string containing the code expression.
+    """
+    def text(operand):
+        kind, index = kinds(operand), indices(operand)
+        if kind == REGISTER:
+            return f'r[{index}]'
+        elif kind == FEATURE:
+            return f'x[{index}]' if feature is None else feature(index)
+
+        # Integral constants are written as in the grammars so that C keeps
+        # the same integer and floating-point promotion rules.
+        value = float(program.consts[index])
+        return str(int(value)) if value.is_integer() else repr(value)
+
+    lines = []
+    for opcode, dest, src in program:
+        if bytecode.SIN <= opcode <= bytecode.TANH:
+            lines.append(EMITTERS[opcode](text(dest)))
+        else:
+            lines.append(EMITTERS[opcode](text(dest), text(src)))
+
+    return '\n'.join(lines)
+
+
+def as_program(program):
+    """Returns a program given as a Program object or as a code expression.
+
+    # Arguments
+        program: A Program object or a string containing a code expression.
+
+    # Returns
+        A Program object.
+    """
+    return from_expression(program) if isinstance(program, str) else program
+
+
+def as_expression(program):
+    """Returns the C code expression for a program given as a Program object 
+    or as a code expression.
+
+    # Arguments
+        program: A Program object or a string containing a code expression.
+
+    # Returns
+        The code expression as a string.
+    """
+    return program if isinstance(program, str) else emit_c(program)
+
+
+def assemble(programs, n_registers, n_features):
+    """Assembles programs into bytecode for the register machine, which is
+    run by the interpreter and NumPy backends.
+
+    Operands index a slot array laid out as the registers, followed by the
+    input features, followed by a pool of constants shared by the population.
+
+    # Arguments
+        programs: A list of Program objects or strings containing code
+            expressions for individuals in the population.
+        n_registers: Number of registers as an integer.
+        n_features: Number of input features as an integer.
+
+    # Returns
+        A tuple containing the instructions as an (n, 3) int32 NumPy array of
+        opcode and operand slots, program offsets as an int64 NumPy array, and
+        the constant pool as a float32 NumPy array.
+    """
+    programs = [as_program(program) for program in programs]
+
+    consts = {}
+    offsets = np.zeros(len(programs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(program) for program in programs])
+    code = np.empty((offsets[-1], 3), dtype=np.int32)
+
+    for i, program in enumerate(programs):
+        pool = np.array([consts.setdefault(value, len(consts)) for value in program.consts.tolist()],
+                        dtype=np.int32) + n_registers + n_features
+
+        rows = code[offsets[i]:offsets[i + 1]]
+        rows[:, 0] = program.opcodes
+
+        for column, operands in ((1, program.dests), (2, program.srcs)):
+            kind, index = kinds(operands), indices(operands)
+            registers, features, constants = kind == REGISTER, kind == FEATURE, kind == CONSTANT
+
+            assert np.all(index[registers] < n_registers)
+            assert np.all(index[features] < n_features)
+
+            rows[registers, column] = index[registers]
+            rows[features, column] = n_registers + index[features]
+            rows[constants, column] = pool[index[constants]]
+
+    return code, offsets, np.array(list(consts), dtype=np.float32)
@@ -0,0 +1,163 @@
+# objcache.py
+
+import os
+import shutil
+import hashlib
+import subprocess
+import uuid
+from functools import lru_cache
+
+# Read from the environment so that worker processes started by joblib or 
+# multiprocessing share the cache configured in the parent.
+directory = os.environ.get('GE_OBJECT_CACHE')
+max_bytes = int(os.environ.get('GE_OBJECT_CACHE_BYTES', 2 ** 30))
+
+
+def configure(path, size=None):
+    """Enables the persistent object cache.
+
+    # Arguments
+        path: A string containing the path for the cache directory, or None
+            to disable the cache.
+        size: Maximum total size of the cache in bytes as an integer or None
+            to keep the current limit.
+
+    # Returns
+        None.
+    """
+    global directory, max_bytes
+
+    directory = path
+    if size is not None:
+        max_bytes = size
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        os.environ['GE_OBJECT_CACHE'] = directory
+        os.environ['GE_OBJECT_CACHE_BYTES'] = str(max_bytes)
+    else:
+        os.environ.pop('GE_OBJECT_CACHE', None)
+
+
+@lru_cache(maxsize=None)
+def compiler_version():
+    """Returns the version of GCC, so that a cache shared across machines 
+    never serves objects built by a different compiler.
+
+    # Returns
+        The version as a string.
+    """
+    # Older GCC releases only support -dumpversion, which is then used.
+    return subprocess.run(['gcc', '-dumpfullversion', '-dumpversion'], 
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+
+@lru_cache(maxsize=None)
+def native_target(flag):
+    """Returns the target options that GCC selects for a flag such as 
+    -march=native on this machine, so that objects built for one CPU are 
+    never served to another.
+
+    # Arguments
+        flag: A compiler flag ending in =native.
+
+    # Returns
+        The target options as a string.
+    """
+    return subprocess.run(['gcc', flag, '-Q', '--help=target'], 
+                          capture_output=True, text=True, check=True).stdout
+
+
+def key(source, flags):
+    """Builds the cache key for a translation unit.
+
+    # Arguments
+        source: A string containing the source code.
+        flags: A list of compiler flags.
+
+    # Returns
+        A hexadecimal digest as a string.
+    """
+    flags = [native_target(flag) if flag.endswith('=native') else flag for flag in flags]
+    text = '\0'.join([compiler_version(), *flags, source])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def fetch(key, dest):
+    """Copies a cached object file to a destination path, marking it as
+    recently used.
+
+    # Arguments
+        key: The cache key as a string.
+        dest: A string containing the destination path.
+
+    # Returns
+        A boolean indicating whether the object was found in the cache.
+    """
+    path = os.path.join(directory, f'{key}.o')
+
+    try:
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+def store(key, src):
+    """Atomically adds an object file to the cache.
+
+    # Arguments
+        key: The cache key as a string.
+        src: A string containing the path of the compiled object file.
+
+    # Returns
+        None.
+    """
+    path = os.path.join(directory, f'{key}.o')
+    tmp_path = os.path.join(directory, f'.{key}.{uuid.uuid4().hex}.tmp')
+
+    os.makedirs(directory, exist_ok=True)
+
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def evict():
+    """Removes the least recently used objects until the cache fits within
+    its size limit.
+
+    # Returns
+        None.
+    """
+    entries = []
+    total = 0
+
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.o'):
+            continue
+
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    entries.sort()
+
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        total -= size
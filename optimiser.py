@@ -1,13 +1,24 @@
 # optimiser.py
 
 import ge
+import checkpoint
+import codegen
+import ir
+import objcache
 
+from deap import creator, tools
+from joblib import Parallel, delayed
 from sklearn.base import BaseEstimator, ClassifierMixin
 from skopt import BayesSearchCV
-from skopt.space import Real, Integer, Categorical
+from skopt.space import Real, Integer, Categorical, Space
+from sklearn.model_selection import check_cv
+
+import numpy as np
+import math
 
 import os
 from datetime import datetime
+import multiprocessing as mp
 import json
 import argparse
 
@@ -19,7 +30,8 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
     def __init__(self, problem='drive', compiler='gcc', n_registers=8, 
                  pop_size=100, ngen=1000, cxpb=0.6, mutpb=0.030339818402497533,
                  elite_size=5, hof_size=7, tournsize=3, max_init_depth=12, 
-                 min_init_depth=7, max_tree_depth=69):
+                 min_init_depth=7, max_tree_depth=69, 
+                 compile_profile='fast-compile'):
         """Initialises the GrammaticalEvolution object.
 
         # Arguments
@@ -36,6 +48,8 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
             max_init_depth: Maximum initial depth as an integer.
             min_init_depth: Minimum initial depth as an integer.
             max_tree_depth: Maximum tree depth as an integer.
+            compile_profile: A string with the name of the compile profile 
+                for generated code, or 'auto'.
 
         # Returns
             None.
@@ -53,26 +67,107 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
         self.max_init_depth = max_init_depth
         self.min_init_depth = min_init_depth
         self.max_tree_depth = max_tree_depth
+        self.compile_profile = compile_profile
 
 
-    def fit(self, X, y):
+    def fit(self, X, y, n_evals=100000):
         """Fit the model to data matrix X and targets y.
 
         # Arguments
             X: The input data as an array-like object.
             y: The target values as an array-like object.
+            n_evals: Desired total number of evaluations as an integer.
 
         # Returns
             Trained estimator object.
         """
-        params = self.constrain_params(vars(self))
+        params = self.constrain_params(vars(self), n_evals)
         print(f'\nParams: {params}\n')
 
-        self.best_individual = ge.run_algorithm(X, y, **params)
+        self.state_ = {}
+        self.best_individual = ge.run_algorithm(X, y, **params, state=self.state_)
         self.model = self
         return self
 
 
+    def extend(self, X, y, n_evals):
+        """Continue fitting from the saved population until the total number 
+        of evaluations reaches n_evals.
+
+        # Arguments
+            X: The input data as an array-like object.
+            y: The target values as an array-like object.
+            n_evals: Desired total number of evaluations as an integer.
+
+        # Returns
+            Trained estimator object.
+        """
+        params = self.constrain_params(vars(self), n_evals)
+        params['ngen'] -= self.state_['ngen']
+
+        if params['ngen'] > 0:
+            self.best_individual = ge.run_algorithm(X, y, **params, state=self.state_)
+
+        return self
+
+
+    def __getstate__(self):
+        """Returns the attributes to pickle. The best individual and the 
+        saved population and hall of fame are stored as genomes, so that 
+        fitted estimators can be sent to worker processes in which the 
+        individual classes have not been created.
+
+        # Returns
+            A dictionary of attributes.
+        """
+        attributes = super().__getstate__()
+
+        if 'best_individual' in attributes:
+            attributes['best_individual'] = pack_individuals([self.best_individual])
+
+        if 'population' in attributes.get('state_', {}):
+            state = dict(self.state_)
+            state['population'] = pack_individuals(state['population'])
+            state['hof'] = state['hof'].maxsize, pack_individuals(state['hof'].items)
+            attributes['state_'] = state
+
+        return attributes
+
+
+    def __setstate__(self, attributes):
+        """Restores pickled attributes and maps the stored genomes back to 
+        individuals with the grammar of the problem.
+
+        # Arguments
+            attributes: A dictionary of attributes.
+
+        # Returns
+            None.
+        """
+        super().__setstate__(attributes)
+
+        if 'best_individual' not in attributes:
+            return
+
+        ge.create_toolbox(self.tournsize)
+        bnf_grammar = ge.set_grammar(self.problem, self.n_registers)
+        max_tree_depth = self.constrain_params(vars(self), None)['max_tree_depth']
+
+        def unpack(packed):
+            return checkpoint.unpack_genomes(*packed, creator.Individual, 
+                                             bnf_grammar, max_tree_depth, 'lazy')
+
+        self.best_individual, = unpack(self.best_individual)
+
+        if 'population' in getattr(self, 'state_', {}):
+            self.state_['population'] = unpack(self.state_['population'])
+
+            hof_size, items = self.state_['hof']
+            self.state_['hof'] = tools.HallOfFame(hof_size)
+            for ind in unpack(items):
+                self.state_['hof'].insert(ind)
+
+
     def predict(self, X):
         """Predict using the grammatical evolution classifier.
 
@@ -83,7 +178,7 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
             Predicted classes as an array-like object.
         """
         return ge.predict(X, 
-                          ge.evaluate_expression(self.best_individual.phenotype),
+                          ir.parse(self.best_individual.phenotype),
                           self.problem,
                           self.compiler,
                           self.n_registers)
@@ -119,7 +214,8 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
         """
         keys = ['problem', 'compiler', 'n_registers', 'pop_size', 'ngen', 
                 'cxpb', 'mutpb', 'elite_size', 'hof_size', 'tournsize', 
-                'max_init_depth', 'min_init_depth', 'max_tree_depth']
+                'max_init_depth', 'min_init_depth', 'max_tree_depth', 
+                'compile_profile']
         
         params = {key: params[key] for key in keys if key in params}
 
@@ -133,6 +229,124 @@ class GrammaticalEvolution(BaseEstimator, ClassifierMixin):
         return params
 
 
+def pack_individuals(individuals):
+    """Stores individuals as their genomes and fitness values.
+
+    # Arguments
+        individuals: A list of grape.Individual objects.
+
+    # Returns
+        A tuple containing the codons, the offset of each genome and the 
+        fitness values as NumPy arrays.
+    """
+    codons, offsets = checkpoint.pack_genomes(individuals)
+    return codons, offsets, np.array([ind.fitness.values[0] for ind in individuals])
+
+
+def fit_and_score(estimator, X_fit, y_fit, X_val, y_val, n_evals, resume):
+    """Fits an estimator on a fold, or resumes it from its saved population, 
+    and scores it on the validation data. Runs in joblib workers, which 
+    return copies of the estimators.
+
+    # Arguments
+        estimator: A GrammaticalEvolution object.
+        X_fit: The training data as a NumPy array.
+        y_fit: The training targets as a NumPy array.
+        X_val: The validation data as a NumPy array.
+        y_val: The validation targets as a NumPy array.
+        n_evals: Desired total number of evaluations as an integer.
+        resume: A boolean indicating whether to extend the saved population.
+
+    # Returns
+        A tuple containing the fitted estimator and its validation score.
+    """
+    if resume:
+        estimator.extend(X_fit, y_fit, n_evals)
+    else:
+        estimator.fit(X_fit, y_fit, n_evals)
+
+    return estimator, estimator.score(X_val, y_val)
+
+
+def successive_halving(X, y, search_spaces, estimator_params, n_candidates=27, 
+                       eta=3, max_evals=100000, cv=3, random_state=None, 
+                       n_jobs=1):
+    """Multi-fidelity search that evaluates candidates on a small budget of 
+    evaluations, keeps the best 1/eta of them, and resumes the survivors from 
+    their saved populations with eta times the budget until max_evals is 
+    reached.
+
+    # Arguments
+        X: The input data as an array-like object.
+        y: The target values as an array-like object.
+        search_spaces: A dictionary mapping parameter names to skopt 
+            dimensions.
+        estimator_params: A dictionary of fixed GrammaticalEvolution 
+            parameters.
+        n_candidates: Number of candidates sampled for the first round as an 
+            integer.
+        eta: The reduction factor between rounds as an integer.
+        max_evals: Number of evaluations for the final round as an integer.
+        cv: Number of cross-validation folds as an integer.
+        random_state: Random seed value as an integer or None.
+        n_jobs: Number of (candidate, fold) pairs fitted in parallel in each 
+            round as an integer.
+
+    # Returns
+        A tuple containing the best parameters as a dictionary, its mean 
+        validation score, and a list of dictionaries recording every 
+        evaluation.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+
+    names = list(search_spaces)
+    points = Space(list(search_spaces.values())).rvs(n_samples=n_candidates, 
+                                                      random_state=random_state)
+    candidates = [dict(zip(names, point)) for point in points]
+
+    folds = [(X[train], y[train], X[test], y[test]) 
+             for train, test in check_cv(cv, y, classifier=True).split(X, y)]
+    
+    n_rounds = int(math.log(n_candidates, eta) + 1e-9) + 1
+    estimators = {i: [GrammaticalEvolution(**estimator_params, **candidate) for _ in folds] 
+                  for i, candidate in enumerate(candidates)}
+    
+    history = []
+    survivors = list(range(n_candidates))
+
+    for r in range(n_rounds):
+        n_evals = max_evals // eta ** (n_rounds - 1 - r)
+        scores = {}
+
+        jobs = [(i, k) for i in survivors for k in range(len(folds))]
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(fit_and_score)(estimators[i][k], *folds[k], n_evals, r > 0) 
+            for i, k in jobs)
+        
+        fold_scores = {i: [] for i in survivors}
+        for (i, k), (estimator, score) in zip(jobs, results):
+            estimators[i][k] = estimator
+            fold_scores[i].append(score)
+
+        for i in survivors:
+            scores[i] = float(np.mean(fold_scores[i]))
+            history.append({'round': r, 'n_evals': n_evals, 
+                            'params': candidates[i], 'score': scores[i]})
+            
+            print(f'Round {r} ({n_evals} evaluations): {candidates[i]} -> {scores[i]:.4f}')
+
+        survivors = sorted(survivors, key=scores.get, reverse=True)
+        survivors = survivors[:max(len(survivors) // eta, 1)]
+
+        for i in list(estimators):
+            if i not in survivors:
+                del estimators[i]
+
+    best = survivors[0]
+    return candidates[best], scores[best], history
+
+
 def main():
     timestamp = datetime.now().replace(microsecond=0).isoformat().replace(':', '')
 
@@ -147,7 +361,7 @@ def main():
     parser.add_argument("-o", "--output", default=f'{timestamp}.json')
     parser.add_argument("--spaces", nargs='+', default=all_spaces)
     parser.add_argument("--problem", default='drive')
-    parser.add_argument("--compiler", default='gcc')
+    parser.add_argument("--compiler", default='gcc', choices=['gcc', 'nvcc', 'interpreter', 'numpy'])
     parser.add_argument("--n_registers", type=int, nargs='+', default=[6, 8, 10])
     parser.add_argument("--pop_size", type=int, nargs='+', default=[10, 100, 1000])
     parser.add_argument("--cxpb", type=float, nargs=2, default=[0.5, 0.7])
@@ -158,10 +372,25 @@ def main():
     parser.add_argument("--max_init_depth", type=int, nargs=2, default=[12, 14])
     parser.add_argument("--min_init_depth", type=int, nargs=2, default=[7, 9]) # min must be >= 4
     parser.add_argument("--max_tree_depth", type=int, nargs=2, default=[25, 75])
+    parser.add_argument("--compile_profile", default='fast-compile', choices=[*codegen.COMPILE_PROFILES, 'auto'])
     parser.add_argument("--n_samples", type=int)
+    parser.add_argument("--search", default='bayes', choices=['bayes', 'halving'])
+    parser.add_argument("--n_candidates", type=int, default=27)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--n_jobs", type=int, default=1)
+    parser.add_argument("--n_points", type=int, default=1)
+    parser.add_argument("--object_cache")
+    parser.add_argument("--object_cache_mb", type=int)
 
     kwargs = dict(parser.parse_args()._get_kwargs())
 
+    # Share the cores between parallel fits when compiling in shards.
+    os.environ['GE_COMPILE_JOBS'] = str(max(mp.cpu_count() // max(kwargs['n_jobs'], 1), 1))
+
+    if kwargs['object_cache']:
+        objcache.configure(kwargs['object_cache'], 
+                           kwargs['object_cache_mb'] and kwargs['object_cache_mb'] * 2 ** 20)
+
     search_spaces = {}
     for space in kwargs['spaces']:
         if space in categorical:
@@ -173,22 +402,43 @@ def main():
     
     X_train, y_train, _, _ = ge.set_dataset(kwargs['problem'], n_samples=kwargs['n_samples'])
 
-    optGE = BayesSearchCV(
-        estimator=GrammaticalEvolution(problem=kwargs['problem'],
-                                       compiler=kwargs['compiler']),
-        search_spaces=search_spaces,
-        n_iter=30,
-        cv=3,
-        verbose=10
-    )
-
-    optGE.fit(X_train, y_train)
-
-    results = {
-        'val_acc': optGE.best_score_,
-        'search_spaces': {key : value.bounds for key, value in search_spaces.items()},
-        'params': GrammaticalEvolution.constrain_params(vars(optGE.best_estimator_))
-    }
+    estimator_params = {'problem': kwargs['problem'], 
+                        'compiler': kwargs['compiler'],
+                        'compile_profile': kwargs['compile_profile']}
+
+    if kwargs['search'] == 'halving':
+        best_params, best_score, history = successive_halving(X_train, 
+                                                              y_train, 
+                                                              search_spaces, 
+                                                              estimator_params, 
+                                                              n_candidates=kwargs['n_candidates'], 
+                                                              eta=kwargs['eta'], 
+                                                              n_jobs=kwargs['n_jobs'])
+
+        results = {
+            'val_acc': best_score,
+            'search_spaces': {key : value.bounds for key, value in search_spaces.items()},
+            'params': GrammaticalEvolution.constrain_params(vars(GrammaticalEvolution(**estimator_params, **best_params))),
+            'history': history
+        }
+    else:
+        optGE = BayesSearchCV(
+            estimator=GrammaticalEvolution(**estimator_params),
+            search_spaces=search_spaces,
+            n_iter=30,
+            cv=3,
+            n_jobs=kwargs['n_jobs'],
+            n_points=kwargs['n_points'],
+            verbose=10
+        )
+
+        optGE.fit(X_train, y_train)
+
+        results = {
+            'val_acc': optGE.best_score_,
+            'search_spaces': {key : value.bounds for key, value in search_spaces.items()},
+            'params': GrammaticalEvolution.constrain_params(vars(optGE.best_estimator_))
+        }
 
     os.makedirs('optimisation', exist_ok=True)
 
@@ -0,0 +1,52 @@
+# profiling.py
+
+import time
+import contextlib
+
+PHASES = ('write_input', 'codegen', 'write_source', 'compile', 'execute',
+          'read_output', 'snapshot')
+
+enabled = False
+
+timings = dict.fromkeys(PHASES, 0.0)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Context manager that adds the duration of its body to the timing of a
+    phase when profiling is enabled.
+
+    # Arguments
+        name: A string containing the name of the phase.
+
+    # Returns
+        A context manager.
+    """
+    if not enabled:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += time.perf_counter() - start_time
+
+
+def reset():
+    """Resets the timings of all phases.
+
+    # Returns
+        None.
+    """
+    for name in PHASES:
+        timings[name] = 0.0
+
+
+def report_items():
+    """Returns the logbook items for the phase timings.
+
+    # Returns
+        A list of strings.
+    """
+    return [f'{name}_time' for name in PHASES]
@@ -0,0 +1,138 @@
+# session.py
+
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+import imagedata
+
+MAX_SESSIONS = 8
+
+_sessions = OrderedDict()
+
+
+class DatasetSession:
+    """Input samples converted once to a contiguous float32 buffer and staged
+    in a memory-mapped file, in shared memory where available, so that every
+    evaluation of a run can reuse them.
+    """
+    def __init__(self, x):
+        """Initialises the DatasetSession object.
+
+        # Arguments
+            x: A NumPy array of input samples.
+
+        # Returns
+            None.
+        """
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.directory = tempfile.mkdtemp(prefix='ge-session-', dir=shm)
+        self.input_path = os.path.join(self.directory, 'input.bin')
+
+        x_mmap = np.memmap(self.input_path, dtype=np.float32, mode='w+', shape=x.shape)
+        x_mmap[:] = x
+        x_mmap.flush()
+        del x_mmap
+
+        self.x = np.memmap(self.input_path, dtype=np.float32, mode='r', shape=x.shape)
+
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+
+    def close(self):
+        """Deletes the staged files.
+
+        # Returns
+            None.
+        """
+        self.x = None
+        self._finalizer()
+
+
+class ImageSession:
+    """Images and window offsets of image-native samples staged in files, in 
+    shared memory where available, for programs that look up window features 
+    at run time.
+    """
+    def __init__(self, x):
+        """Initialises the ImageSession object.
+
+        # Arguments
+            x: An imagedata.WindowedImages object.
+
+        # Returns
+            None.
+        """
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.directory = tempfile.mkdtemp(prefix='ge-session-', dir=shm)
+        self.images_path = os.path.join(self.directory, 'images.bin')
+        self.offsets_path = os.path.join(self.directory, 'offsets.bin')
+
+        np.ascontiguousarray(x.images, dtype=np.uint8).tofile(self.images_path)
+        np.ascontiguousarray(x.offsets, dtype=np.uint32).tofile(self.offsets_path)
+
+        self.x = x
+        self._windows = None
+
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+
+    @property
+    def windows(self):
+        """Window features materialised on first use for backends that 
+        cannot look them up at run time.
+        """
+        if self._windows is None:
+            self._windows = self.x.windows()
+        return self._windows
+
+
+    def close(self):
+        """Deletes the staged files.
+
+        # Returns
+            None.
+        """
+        self.x = None
+        self._windows = None
+        self._finalizer()
+
+
+def get(x):
+    """Returns the dataset session for an array, creating one on first use.
+    Sessions are looked up by array identity and the least recently used are
+    closed when more than MAX_SESSIONS are open.
+
+    # Arguments
+        x: A NumPy array of input samples, an imagedata.WindowedImages 
+            object or a session object.
+
+    # Returns
+        A DatasetSession or ImageSession object.
+    """
+    if isinstance(x, (DatasetSession, ImageSession)):
+        return x
+
+    if not isinstance(x, imagedata.WindowedImages):
+        x = np.asarray(x)
+
+    entry = _sessions.get(id(x))
+    if entry is not None and entry[0]() is x:
+        _sessions.move_to_end(id(x))
+        return entry[1]
+
+    if isinstance(x, imagedata.WindowedImages):
+        data = ImageSession(x)
+    else:
+        data = DatasetSession(x)
+    
+    _sessions[id(x)] = (weakref.ref(x), data)
+
+    while len(_sessions) > MAX_SESSIONS:
+        _sessions.popitem(last=False)[1][1].close()
+
+    return data
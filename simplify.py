@@ -0,0 +1,131 @@
+# simplify.py
+
+import bytecode
+import ir
+
+enabled = True
+
+# Instructions that leave the destination unchanged for a constant source.
+# Adding zero may only flip the sign of a zero result, which does not change
+# any prediction class.
+IDENTITIES = {(bytecode.ADD, 0.0), (bytecode.SUB, 0.0), (bytecode.MUL, 1.0),
+              (bytecode.PDIV, 1.0), (bytecode.AQ, 0.0)}
+
+
+def constant(program, operand):
+    """Returns the value of a constant operand.
+
+    # Arguments
+        program: An ir.Program object.
+        operand: An encoded operand as an integer.
+
+    # Returns
+        The value as a float, or None if the operand is not a constant.
+    """
+    if ir.kinds(operand) != ir.CONSTANT:
+        return None
+
+    return float(program.consts[ir.indices(operand)])
+
+
+def statements(program):
+    """Groups the instructions of a program into statements, each with the
+    if_gt conditions that guard it.
+
+    # Arguments
+        program: An ir.Program object.
+
+    # Returns
+        A list of tuples containing a list of (a, b) conditions and an
+        (opcode, dest, src) instruction.
+    """
+    result = []
+    guards = []
+
+    for opcode, dest, src in program:
+        if opcode == bytecode.IF_GT:
+            guards.append((dest, src))
+        else:
+            result.append((guards, (opcode, dest, src)))
+            guards = []
+
+    return result
+
+
+def fold_guards(program, guards):
+    """Folds constant conditions of a statement.
+
+    # Arguments
+        program: An ir.Program object.
+        guards: A list of (a, b) conditions.
+
+    # Returns
+        A list of the remaining conditions without duplicates, or None if a
+        condition is always false.
+    """
+    folded = []
+    for a, b in guards:
+        # x > x is false for every value, including NaN.
+        if a == b:
+            return None
+
+        value_a, value_b = constant(program, a), constant(program, b)
+        if value_a is not None and value_b is not None:
+            if value_a > value_b:
+                continue
+            return None
+
+        if (a, b) not in folded:
+            folded.append((a, b))
+
+    return folded
+
+
+def simplify(program):
+    """Removes instructions that cannot affect the result r[0] and applies
+    peephole simplifications: conditions that are constant or compare an
+    operand with itself are folded, and self-moves and identity operations
+    are dropped. Programs that differ only in dead code produce the same
+    simplified program.
+
+    # Arguments
+        program: An ir.Program object.
+
+    # Returns
+        A simplified ir.Program object sharing the constant pool.
+    """
+    simplified = []
+    for guards, (opcode, dest, src) in statements(program):
+        guards = fold_guards(program, guards)
+
+        if guards is None:
+            continue
+        if opcode == bytecode.MOV and dest == src:
+            continue
+        if (opcode, constant(program, src)) in IDENTITIES:
+            continue
+
+        simplified.append((guards, (opcode, dest, src)))
+
+    # Backward liveness analysis of the registers read before r[0] is returned.
+    live = {ir.encode(ir.REGISTER, 0)}
+    kept = []
+    for guards, (opcode, dest, src) in reversed(simplified):
+        if dest not in live:
+            continue
+
+        # A move overwrites its destination unless a condition may skip it.
+        if opcode == bytecode.MOV and not guards:
+            live.discard(dest)
+
+        live.add(src)
+        live.update(operand for guard in guards for operand in guard)
+
+        kept.append((guards, (opcode, dest, src)))
+
+    instructions = []
+    for guards, instruction in reversed(kept):
+        instructions.extend((bytecode.IF_GT, a, b) for a, b in guards)
+        instructions.append(instruction)
+
+    return ir.Program.from_instructions(instructions, program.consts)
@@ -0,0 +1,152 @@
+# vectorised.py
+
+import numpy as np
+
+import bytecode
+import ir
+
+
+def apply(opcode, a, b):
+    """Applies a single register-machine instruction to whole columns.
+
+    Operations that C performs in double precision are computed in float64
+    and rounded back to float32 so that results match the gcc backend. The
+    transcendental functions may differ from libm's float versions by one ulp.
+
+    # Arguments
+        opcode: The instruction opcode as an integer.
+        a: The destination operand as a float32 NumPy array.
+        b: The source operand as a float32 NumPy array or scalar.
+
+    # Returns
+        The new value of the destination as a float32 NumPy array.
+    """
+    if opcode == bytecode.ADD:
+        return a + b
+    elif opcode == bytecode.SUB:
+        return a - b
+    elif opcode == bytecode.MUL:
+        return a * b
+    elif opcode == bytecode.PDIV:
+        return np.where(b != 0, a / b, (a.astype(np.float64) + 10e6).astype(np.float32))
+    elif opcode == bytecode.AQ:
+        b = np.float64(b) if np.isscalar(b) else b.astype(np.float64)
+        return (a / np.sqrt(1 + np.power(b, 2))).astype(np.float32)
+    elif opcode == bytecode.MOV:
+        return np.broadcast_to(b, a.shape).astype(np.float32)
+    elif opcode == bytecode.SIN:
+        return np.sin(a.astype(np.float64)).astype(np.float32)
+    elif opcode == bytecode.COS:
+        return np.cos(a.astype(np.float64)).astype(np.float32)
+    elif opcode == bytecode.TANH:
+        return np.tanh(a.astype(np.float64)).astype(np.float32)
+
+    raise ValueError(f'Unknown opcode: {opcode}')
+
+
+def evaluate(code, x_columns, consts, n_registers, r=None):
+    """Evaluates the bytecode of one program over all samples at once.
+
+    # Arguments
+        code: An (n, 3) NumPy array of instructions for the program.
+        x_columns: A float32 NumPy array of shape (n_features, n_samples).
+        consts: The constant pool as a float32 NumPy array.
+        n_registers: Number of registers as an integer.
+        r: A float32 NumPy array of shape (n_registers, n_samples) with the 
+            initial registers, which is updated in place, or None to 
+            initialise the registers from the features.
+
+    # Returns
+        The value of r[0] for every sample as a float32 NumPy array.
+    """
+    n_features = x_columns.shape[0]
+    if r is None:
+        r = x_columns[np.arange(n_registers) % n_features].copy()
+
+    def fetch(slot):
+        if slot < n_registers:
+            return r[slot]
+        elif slot < n_registers + n_features:
+            return x_columns[slot - n_registers]
+        return consts[slot - n_registers - n_features]
+
+    guard = None
+    for opcode, a, b in code:
+        if opcode == bytecode.IF_GT:
+            condition = np.greater(fetch(a), fetch(b))
+            guard = condition if guard is None else guard & condition
+            continue
+
+        value = apply(opcode, r[a], fetch(b))
+
+        if guard is None:
+            r[a] = value
+        else:
+            r[a] = np.where(guard, value, r[a])
+            guard = None
+
+    return r[0]
+
+
+def run_program(x, programs, n_registers):
+    """Evaluates programs with batched NumPy column operations.
+
+    # Arguments
+        x: A NumPy array of input samples.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    x_columns = np.ascontiguousarray(np.asarray(x, dtype=np.float32).T)
+    code, offsets, consts = ir.assemble(programs, n_registers, x_columns.shape[0])
+    pred = np.empty((len(programs), x_columns.shape[1]), dtype=np.float32)
+
+    with np.errstate(all='ignore'):
+        for i in range(len(programs)):
+            pred[i] = evaluate(code[offsets[i]:offsets[i + 1]], x_columns,
+                               consts, n_registers)
+
+    return pred
+
+
+def run_states(x, code, offsets, consts, n_registers, init, store, states):
+    """Evaluates assembled programs with batched NumPy column operations, 
+    starting from and storing register states.
+
+    # Arguments
+        x: A float32 NumPy array of input samples.
+        code: An (n, 3) int32 NumPy array of instructions.
+        offsets: An int64 NumPy array of program offsets.
+        consts: The constant pool as a float32 NumPy array.
+        n_registers: Number of registers as an integer.
+        init: An int64 NumPy array with the index of the state each program 
+            starts from, or -1 to initialise the registers from the features.
+        store: An int64 NumPy array with the index of the state each program 
+            writes its final registers to, or -1.
+        states: A float32 NumPy array of shape (n_states, n_samples, 
+            n_registers), which is updated in place. A program may start 
+            from a state stored by an earlier program.
+
+    # Returns
+        A NumPy array of floating-point values with predictions.
+    """
+    x_columns = np.ascontiguousarray(x.T)
+    pred = np.empty((len(offsets) - 1, x_columns.shape[1]), dtype=np.float32)
+
+    with np.errstate(all='ignore'):
+        for i in range(len(offsets) - 1):
+            if init[i] < 0:
+                r = x_columns[np.arange(n_registers) % x_columns.shape[0]].copy()
+            else:
+                r = states[init[i]].T.copy()
+
+            pred[i] = evaluate(code[offsets[i]:offsets[i + 1]], x_columns,
+                               consts, n_registers, r)
+
+            if store[i] >= 0:
+                states[store[i]] = r.T
+
+    return pred
@@ -0,0 +1,250 @@
+# worker.py
+
+import os
+import atexit
+import shutil
+import tempfile
+import time
+import traceback
+import _ctypes
+import multiprocessing as mp
+
+import numpy as np
+
+import ir
+import codegen
+import interpreter
+
+COMPILERS = ('gcc', 'interpreter')
+
+enabled = False
+
+_worker = None
+
+
+def run_bytecode(x, pred, code, offsets, consts, n_registers):
+    """Evaluates assembled programs with the interpreter inside the worker.
+
+    # Arguments
+        x: A float32 NumPy array of input samples.
+        pred: A float32 NumPy array to write predictions to.
+        code: An (n, 3) int32 NumPy array of instructions.
+        offsets: An int64 NumPy array of program offsets.
+        consts: The constant pool as a float32 NumPy array.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        None.
+    """
+    library = interpreter.load_library()
+
+    library.evaluate(x, x.shape[0], x.shape[1], n_registers, code, offsets,
+                     len(offsets) - 1, consts, len(consts), pred)
+
+
+def run_source(x, pred, source, flags):
+    """Compiles C source into a shared library, loads it into the worker and
+    runs it.
+
+    # Arguments
+        x: A float32 NumPy array of input samples.
+        pred: A float32 NumPy array to write predictions to.
+        source: A string containing the C source code.
+        flags: A list of additional compiler flags.
+
+    # Returns
+        None.
+    """
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        library = codegen.load_library_gcc(source, tmpdirname, flags)
+
+    try:
+        library.evaluate_population(x, x.shape[0], pred)
+    finally:
+        _ctypes.dlclose(library._handle)
+
+
+def serve(conn):
+    """Main loop of the evaluator worker process. Holds the input samples in
+    memory and evaluates programs sent over the pipe, writing predictions to
+    a memory-mapped buffer shared with the host.
+
+    # Arguments
+        conn: A multiprocessing.connection.Connection object.
+
+    # Returns
+        None.
+    """
+    x = None
+
+    while True:
+        command, *args = conn.recv()
+
+        if command == 'stop':
+            break
+
+        try:
+            if command == 'load':
+                input_path, shape = args
+                x = np.memmap(input_path, dtype=np.float32, mode='r', shape=shape)
+            else:
+                pred_path, n_programs, *payload = args
+                pred = np.memmap(pred_path, dtype=np.float32, mode='r+',
+                                 shape=(n_programs, x.shape[0]))
+
+                if command == 'bytecode':
+                    run_bytecode(x, pred, *payload)
+                elif command == 'source':
+                    run_source(x, pred, *payload)
+
+                pred.flush()
+                del pred
+
+            conn.send(('ok',))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+
+class EvaluatorWorker:
+    """Host-side handle for a long-lived evaluator process. Input samples are
+    loaded into the worker once per dataset session and predictions are
+    returned through a shared memory-mapped buffer.
+    """
+    def __init__(self):
+        """Initialises the EvaluatorWorker object and starts the process.
+
+        # Returns
+            None.
+        """
+        context = mp.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=serve, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        self.directory = tempfile.mkdtemp(prefix='ge-worker-', dir=shm)
+        self.data = None
+        self.pred = None
+        self.pred_path = None
+
+
+    def request(self, *message):
+        """Sends a message to the worker and waits for its reply.
+
+        # Arguments
+            message: The command and its arguments.
+
+        # Returns
+            None.
+        """
+        try:
+            self.conn.send(message)
+            reply = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError('Evaluator worker exited unexpectedly.') from e
+
+        if reply[0] == 'error':
+            raise RuntimeError(f'Evaluator worker failed:\n{reply[1]}')
+
+
+    def buffer(self, n_programs, n_samples):
+        """Returns the shared prediction buffer, growing it if required.
+
+        # Arguments
+            n_programs: Number of programs as an integer.
+            n_samples: Number of samples as an integer.
+
+        # Returns
+            A float32 NumPy array of shape (n_programs, n_samples).
+        """
+        size = max(n_programs * n_samples, 1)
+
+        if self.pred is None or self.pred.size < size:
+            if self.pred_path:
+                self.pred = None
+                os.remove(self.pred_path)
+
+            self.pred_path = os.path.join(self.directory, f'pred{size}.bin')
+            self.pred = np.memmap(self.pred_path, dtype=np.float32, mode='w+', shape=(size,))
+
+        return self.pred[:n_programs * n_samples].reshape(n_programs, n_samples)
+
+
+    def run_program(self, data, programs, compiler, n_registers):
+        """Evaluates programs in the worker.
+
+        # Arguments
+            data: A session.DatasetSession object.
+            programs: A list of ir.Program objects or strings containing
+                code expressions for individuals in the population.
+            compiler: A string indicating the compiler to use.
+            n_registers: Number of registers as an integer.
+
+        # Returns
+            A NumPy array of predictions backed by the shared buffer. It is
+            only valid until the next call.
+        """
+        if not programs:
+            return np.empty((0, data.x.shape[0]), dtype=np.float32)
+
+        if data is not self.data:
+            self.request('load', data.input_path, data.x.shape)
+            self.data = data
+
+        pred = self.buffer(len(programs), data.x.shape[0])
+
+        if compiler == 'interpreter':
+            code, offsets, consts = ir.assemble(programs, n_registers, data.x.shape[1])
+            self.request('bytecode', self.pred_path, len(programs), 
+                         np.ascontiguousarray(code), offsets, consts, n_registers)
+        elif compiler == 'gcc':
+            expressions = [ir.as_expression(program) for program in programs]
+            source = codegen.generate_library_gcc(data.x.shape[1], expressions, n_registers)
+            profile = codegen.resolve_profile(compiler, data.x.shape[0])
+            start_time = time.perf_counter()
+
+            self.request('source', self.pred_path, len(programs), source, 
+                         codegen.compile_flags(compiler, profile))
+
+            codegen.record_profile_timing(compiler, data.x.shape[0], profile, 
+                                          time.perf_counter() - start_time, len(programs))
+
+        return pred
+
+
+    def close(self):
+        """Stops the worker process and deletes the shared buffer.
+
+        # Returns
+            None.
+        """
+        if self.process.is_alive():
+            self.conn.send(('stop',))
+            self.process.join()
+
+        self.pred = None
+        shutil.rmtree(self.directory, True)
+
+
+def run_program(data, programs, compiler, n_registers):
+    """Evaluates programs in the evaluator worker, starting it on
+    first use.
+
+    # Arguments
+        data: A session.DatasetSession object.
+        programs: A list of ir.Program objects or strings containing
+            code expressions for individuals in the population.
+        compiler: A string indicating the compiler to use.
+        n_registers: Number of registers as an integer.
+
+    # Returns
+        A NumPy array of predictions backed by the shared buffer.
+    """
+    global _worker
+
+    if _worker is None or not _worker.process.is_alive():
+        _worker = EvaluatorWorker()
+        atexit.register(_worker.close)
+
+    return _worker.run_program(data, programs, compiler, n_registers)